@@ -34,20 +34,75 @@ from PySide import QtCore
 from PySide.QtCore import QRunnable, QObject
 from FreeCAD import Units
 import TemplateBuilder
+import MeshPart
+
+
+def computePatchNames(bc_group, mesh_obj):
+    """ Match the references of the boundaries to the faces of the meshed part. Returns a dict giving the names of
+    the part faces, and the patch type, for each boundary label. Faces not assigned to any boundary are collected
+    under 'defaultFaces'. The ShapeFaceNames of mesh_obj must already have been set up. """
+    create_patches = {}
+    shape_face_names = mesh_obj.ShapeFaceNames
+
+    # Make list of list of all boundary references for their corresponding boundary
+    boundary_ref_lists = []
+    for bc_id, bc_obj in enumerate(bc_group):
+        boundary_ref_lists.append(bc_obj.References)
+
+    # Match them up with faces in the meshed part
+    matched_faces = CfdTools.matchFacesToTargetShape(boundary_ref_lists, mesh_obj.Part.Shape)
+
+    bc_lists = []
+    for bc in bc_group:
+        bc_lists.append([])
+    for i in range(len(matched_faces)):
+        if matched_faces[i]:
+            nb, bref = matched_faces[i][0]
+            bc_lists[nb].append(shape_face_names[i])
+            for k in range(len(matched_faces[i])-1):
+                nb2, bref2 = matched_faces[i][k+1]
+                if nb2 != nb:
+                    cfdMessage(
+                        "Boundary '{}' reference {}:{} also assigned as "
+                        "boundary '{}' reference {}:{}\n".format(
+                            bc_group[nb].Label, bref[0], bref[1], bc_group[nb2].Label, bref2[0], bref2[1]))
+
+    for bc_id, bc_obj in enumerate(bc_group):
+        bcType = bc_obj.BoundaryType
+        bcSubType = bc_obj.BoundarySubType
+        patchType = CfdTools.getPatchType(bcType, bcSubType)
+        create_patches[bc_obj.Label] = {
+            'PatchNamesList': tuple(bc_lists[bc_id]),  # Tuple used so that case writer outputs as an array
+            'PatchType': patchType
+        }
+
+    # Add default faces
+    def_bc_list = []
+    for i in range(len(matched_faces)):
+        if not matched_faces[i]:
+            def_bc_list.append(shape_face_names[i])
+    if def_bc_list:
+        create_patches['defaultFaces'] = {
+            'PatchNamesList': tuple(def_bc_list),
+            'PatchType': "patch"
+        }
+
+    return create_patches
 
 
 class CfdCaseWriterFoam:
     def __init__(self, analysis_obj):
         self.analysis_obj = analysis_obj
-        self.solver_obj = CfdTools.getSolver(analysis_obj)
-        self.physics_model = CfdTools.getPhysicsModel(analysis_obj)
-        self.mesh_obj = CfdTools.getMesh(analysis_obj)
-        self.material_objs = CfdTools.getMaterials(analysis_obj)
-        self.bc_group = CfdTools.getCfdBoundaryGroup(analysis_obj)
-        self.initial_conditions = CfdTools.getInitialConditions(analysis_obj)
-        self.porousZone_objs = CfdTools.getPorousZoneObjects(analysis_obj)
-        self.initialisationZone_objs = CfdTools.getInitialisationZoneObjects(analysis_obj)
-        self.zone_objs = CfdTools.getZoneObjects(analysis_obj)
+        members = CfdTools.classifyAnalysisGroup(analysis_obj)
+        self.solver_obj = members['Solver']
+        self.physics_model = members['PhysicsModel']
+        self.mesh_obj = members['Mesh']
+        self.material_objs = members['Materials']
+        self.bc_group = members['BoundaryGroup']
+        self.initial_conditions = members['InitialConditions']
+        self.porousZone_objs = members['PorousZones']
+        self.initialisationZone_objs = members['InitialisationZones']
+        self.zone_objs = members['Zones']
         self.mesh_generated = False
         self.working_dir = CfdTools.getOutputPath(self.analysis_obj)
 
@@ -105,13 +160,8 @@ class CfdCaseWriterFoam:
         cfdMessage("Matching boundary conditions ...\n")
         self.setupPatchNames()
 
-        TemplateBuilder.TemplateBuilder(self.case_folder, self.template_path, self.settings)
-
-        # Update Allrun permission - will fail silently on Windows
-        fname = os.path.join(self.case_folder, "Allrun")
-        import stat
-        s = os.stat(fname)
-        os.chmod(fname, s.st_mode | stat.S_IEXEC)
+        TemplateBuilder.TemplateBuilder(self.case_folder, self.template_path, self.settings,
+                                        executable_files=["Allrun"])
 
         cfdMessage("Successfully wrote case to folder {}\n".format(self.working_dir))
         return True
@@ -383,7 +433,6 @@ class CfdCaseWriterFoam:
                 if not os.path.exists(path):
                     os.makedirs(path)
                 fname = os.path.join(path, r[0]+u".stl")
-                import MeshPart
                 sel_obj = self.analysis_obj.Document.getObject(r[0])
                 shape = sel_obj.Shape
                 meshStl = MeshPart.meshFromShape(shape, LinearDeflection=self.mesh_obj.STLLinearDeflection)
@@ -472,41 +521,8 @@ class CfdCaseWriterFoam:
         # Init in case not meshed yet
         CfdMeshTools.CfdMeshTools(self.mesh_obj)
         settings = self.settings
-        settings['createPatches'] = {}
         bc_group = self.bc_group
-        mobj = self.mesh_obj
-
-        # Make list of list of all boundary references for their corresponding boundary
-        boundary_ref_lists = []
-        for bc_id, bc_obj in enumerate(bc_group):
-            boundary_ref_lists.append(bc_obj.References)
-
-        # Match them up with faces in the meshed part
-        matched_faces = CfdTools.matchFacesToTargetShape(boundary_ref_lists, mobj.Part.Shape)
-
-        bc_lists = []
-        for bc in bc_group:
-            bc_lists.append([])
-        for i in range(len(matched_faces)):
-            if matched_faces[i]:
-                nb, bref = matched_faces[i][0]
-                bc_lists[nb].append(mobj.ShapeFaceNames[i])
-                for k in range(len(matched_faces[i])-1):
-                    nb2, bref2 = matched_faces[i][k+1]
-                    if nb2 != nb:
-                        cfdMessage(
-                            "Boundary '{}' reference {}:{} also assigned as "
-                            "boundary '{}' reference {}:{}\n".format(
-                                bc_group[nb].Label, bref[0], bref[1], bc_group[nb2].Label, bref2[0], bref2[1]))
-
-        for bc_id, bc_obj in enumerate(bc_group):
-            bcType = bc_obj.BoundaryType
-            bcSubType = bc_obj.BoundarySubType
-            patchType = CfdTools.getPatchType(bcType, bcSubType)
-            settings['createPatches'][bc_obj.Label] = {
-                'PatchNamesList': tuple(bc_lists[bc_id]),  # Tuple used so that case writer outputs as an array
-                'PatchType': patchType
-            }
+        settings['createPatches'] = computePatchNames(bc_group, self.mesh_obj)
 
         for regionObj in CfdTools.getMeshRefinementObjs(self.mesh_obj):
             if regionObj.Baffle:
@@ -544,16 +560,3 @@ class CfdCaseWriterFoam:
                                                 tempBaffleListSlave.append(regionObj.Name+sub[0]+elems+"_slave")
                     settings['createPatchesSnappyBaffles'][bc_obj.Label] = {"PatchNamesList" : tuple(tempBaffleList),
                                                                             "PatchNamesListSlave" : tuple(tempBaffleListSlave)}
-
-        # Add default faces
-        flagName = False
-        def_bc_list = []
-        for i in range(len(matched_faces)):
-            if not matched_faces[i]:
-                def_bc_list.append(mobj.ShapeFaceNames[i])
-                flagName = True
-        if flagName:
-            settings['createPatches']['defaultFaces'] = {
-                'PatchNamesList': tuple(def_bc_list),
-                'PatchType': "patch"
-            }
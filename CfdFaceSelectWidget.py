@@ -214,7 +214,7 @@ class CfdFaceSelectWidget:
               sub + " @ " + str(selected_point))
         if hasattr(selected_object, "Shape") and sub:
             if sub.startswith('Solid'):  # getElement doesn't work for solids
-                elt = selected_object.Shape.Solids[int(sub.lstrip('Solid')) - 1]
+                elt = selected_object.Shape.Solids[int(sub[len('Solid'):]) - 1]
             else:
                 elt = selected_object.Shape.getElement(sub)
             selection = None
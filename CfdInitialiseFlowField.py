@@ -137,12 +137,13 @@ class _ViewProviderCfdInitialseInternalFlowField:
         if analysis_object is None:
             CfdTools.cfdError("No parent analysis object found")
             return False
-        physics_model = CfdTools.getPhysicsModel(analysis_object)
+        members = CfdTools.classifyAnalysisGroup(analysis_object)
+        physics_model = members['PhysicsModel']
         if not physics_model:
             CfdTools.cfdError("Analysis object must have a physics object")
             return False
-        boundaries = CfdTools.getCfdBoundaryGroup(analysis_object)
-        material_objs = CfdTools.getMaterials(analysis_object)
+        boundaries = members['BoundaryGroup']
+        material_objs = members['Materials']
 
         import _TaskPanelCfdInitialiseInternalFlowField
         taskd = _TaskPanelCfdInitialiseInternalFlowField._TaskPanelCfdInitialiseInternalFlowField(
@@ -40,30 +40,143 @@ except ImportError:  # Backward compat
     from PyObjects import _FemMeshGmsh
 from FreeCAD import Units
 import os
-import platform
+import itertools
+import random
+from collections import defaultdict
 import shutil
-import subprocess
+try:
+    from shutil import which
+except ImportError:  # Python 2
+    from distutils.spawn import find_executable as which
+import sys
 import CfdTools
 import math
+import numpy
+import Mesh
 import MeshPart
 import TemplateBuilder
 import Part
 import CfdCaseWriterFoam
 
+IS_WINDOWS = sys.platform.startswith('win')
+
+# Template directory for the mesh case
+MESH_TEMPLATE_PATH = os.path.join(CfdTools.get_module_path(), "data", "defaultsMesh")
+
+# Format of a single ASCII STL facet, applied to a row of [normal, vertex1, vertex2, vertex3]
+STL_FACET_FORMAT = (" facet normal %.17g %.17g %.17g\n"
+                    "  outer loop\n"
+                    "    vertex %.17g %.17g %.17g\n"
+                    "    vertex %.17g %.17g %.17g\n"
+                    "    vertex %.17g %.17g %.17g\n"
+                    "  endloop\n"
+                    " endfacet")
+
+# Maximum number of internal point candidates along each axis of the bounding box grid, and in total before
+# falling back to random sampling
+INSIDE_POINT_GRID_MAX = 16
+INSIDE_POINT_GRID_CHECKS = 512
+
+# Write buffer for STL output, so that large surfaces are flushed in few system calls
+STL_WRITE_BUFFER_SIZE = 1 << 20
+
+
+def gridCandidates(mins, lengths, counts):
+    """ Yield the cell centres of successively finer grids over a box, each doubling the number of cells along each
+    axis up to the given counts. Each grid is scanned from the centre of the box outward, skipping points already
+    yielded for a coarser grid. """
+    mins = numpy.asarray(mins, dtype=float)
+    lengths = numpy.asarray(lengths, dtype=float)
+    counts = numpy.asarray(counts)
+    seen = set()
+    n = numpy.ones(3, dtype=int)
+    while True:
+        n = numpy.minimum(n, counts)
+        fractions = numpy.array(list(itertools.product(*[(numpy.arange(k) + 0.5)/k for k in n])))
+        offsets = (fractions - 0.5)*lengths
+        for i in numpy.argsort((offsets*offsets).sum(axis=1), kind='mergesort'):
+            key = tuple(fractions[i])
+            if key not in seen:
+                seen.add(key)
+                yield tuple((mins + fractions[i]*lengths).tolist())
+        if (n == counts).all():
+            return
+        n = n*2
+
+
+def facetPoints(mesh, scale):
+    """ Return an array with a row of nine vertex coordinates for each facet of the mesh, multiplied by scale """
+    points, facets = mesh.Topology
+    pts = numpy.fromiter((c for p in points for c in p), dtype=numpy.float64).reshape(-1, 3)
+    pts *= scale
+    return pts[numpy.array(facets, dtype=numpy.intp).reshape(-1, 3)].reshape(-1, 9)
+
+
+def facetNormals(facet_points):
+    """ Return the unit normals of facets given as rows of nine vertex coordinates """
+    p = facet_points.reshape(-1, 3, 3)
+    n = numpy.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+    mag = numpy.linalg.norm(n, axis=1)
+    mag[mag == 0.0] = 1.0  # Leave degenerate facets with a zero normal
+    return n/mag[:, numpy.newaxis]
+
+
+def writeStlSolid(fid, solid_name, facet_points):
+    """ Write a named ASCII STL solid to an open file, from an array with a row of nine vertex coordinates per
+    facet """
+    fid.write("solid {}\n".format(solid_name))
+    if len(facet_points):
+        # Interleave normal and the three vertices of each facet into one row
+        numpy.savetxt(fid, numpy.hstack((facetNormals(facet_points), facet_points)), fmt=STL_FACET_FORMAT)
+    fid.write("endsolid {}\n".format(solid_name))
+
+
+def writeStl(file_name, solids):
+    """ Write an ASCII STL file from a list of (solid name, facet points) pairs. The solid names become the region
+    (patch) names in OpenFOAM. """
+    with open(file_name, 'w', buffering=STL_WRITE_BUFFER_SIZE) as fid:
+        for (solid_name, facet_points) in solids:
+            writeStlSolid(fid, solid_name, facet_points)
+
+
+# Resolved gmsh executable for each value of PATH it has been looked up with
+GMSH_EXECUTABLE_CACHE = {}
+
+
+def getGmshExecutable():
+    """ Return the path to the gmsh executable, only searching for it the first time for a given PATH """
+    path_env = os.environ.get("PATH", "")
+    exe = GMSH_EXECUTABLE_CACHE.get(path_env)
+    if exe is None:
+        if IS_WINDOWS:
+            exe = os.path.join(FreeCAD.getHomePath(), 'bin', 'gmsh.exe')
+        else:
+            exe = which("gmsh")
+            if not exe:
+                raise IOError("gmsh executable not found in PATH")
+        GMSH_EXECUTABLE_CACHE[path_env] = exe
+    return exe
+
 
 class CfdMeshTools:
     def __init__(self, cart_mesh_obj):
         self.mesh_obj = cart_mesh_obj
         self.analysis = CfdTools.getParentAnalysisObject(self.mesh_obj)
+        self.boundaries = None
 
         self.part_obj = self.mesh_obj.Part  # Part to mesh
         self.scale = 0.001  # Scale mm to m
 
+        # Each access to Shape and its sub-shapes creates a new wrapper of the underlying shape, so retrieve once
+        self.part_shape = self.part_obj.Shape
+        self.part_faces = self.part_shape.Faces
+        self.part_bound_box = self.part_shape.BoundBox
+
         # Default to 2 % of bounding box characteristic length
         self.clmax = Units.Quantity(self.mesh_obj.CharacteristicLengthMax).Value
         if self.clmax <= 0.0:
-            shape = self.part_obj.Shape
-            cl_bound_box = math.sqrt(shape.BoundBox.XLength**2 + shape.BoundBox.YLength**2 + shape.BoundBox.ZLength**2)
+            bound_box = self.part_bound_box
+            cl_bound_box = math.sqrt(bound_box.XLength**2 + bound_box.YLength**2 + bound_box.ZLength**2)
             self.clmax = 0.02*cl_bound_box  # Always in internal format, i.e. mm
 
         # Only used by gmsh - what purpose?
@@ -71,11 +184,7 @@ class CfdMeshTools:
 
         self.dimension = self.mesh_obj.ElementDimension
 
-        shape_face_names = []
-        for (i, f) in enumerate(self.part_obj.Shape.Faces):
-            face_name = ("face{}".format(i))
-            shape_face_names.append(face_name)
-        self.mesh_obj.ShapeFaceNames = shape_face_names
+        self.mesh_obj.ShapeFaceNames = ["face{}".format(i) for i in range(len(self.part_faces))]
 
         self.cf_settings = {}
         self.snappy_settings = {}
@@ -84,6 +193,9 @@ class CfdMeshTools:
 
         self.error = False
 
+        # Surface triangulations as lists of (shape, mesh), keyed by (shape hash, linear deflection)
+        self.mesh_cache = {}
+
         output_path = CfdTools.getOutputPath(self.analysis)
         self.getFilePaths(output_path)
 
@@ -97,12 +209,11 @@ class CfdMeshTools:
 
         # Check for 2D boundaries
         twoDPlanes = []
-        analysis_obj = CfdTools.getParentAnalysisObject(self.mesh_obj)
+        analysis_obj = self.analysis
         if not analysis_obj:
             analysis_obj = CfdTools.getActiveAnalysis()
         if analysis_obj:
-            boundaries = CfdTools.getCfdBoundaryGroup(analysis_obj)
-            for b in boundaries:
+            for b in self.getBoundaries(analysis_obj):
                 if b.BoundaryType == 'constraint' and \
                    b.BoundarySubType == 'twoDBoundingPlane':
                     twoDPlanes.append(b.Name)
@@ -122,27 +233,22 @@ class CfdMeshTools:
             if len(fShape.Faces) == 0 or len(bShape.Faces) == 0:
                 raise RuntimeError("A 2D bounding plane is empty.")
             else:
-                allFFacesPlanar = True
-                allBFacesPlanar = True
-                for faces in fShape.Faces:
-                    if not isinstance(faces.Surface, Part.Plane):
-                        allFFacesPlanar = False
-                        break
-                for faces in bShape.Faces:
-                    if not isinstance(faces.Surface, Part.Plane):
-                        allBFacesPlanar = False
-                        break
-                if allFFacesPlanar and allBFacesPlanar:
-                    A1 = fShape.Faces[0].Surface.Axis
-                    A1.multiply(1.0/A1.Length)
-                    A2 = bShape.Faces[0].Surface.Axis
-                    A2.multiply(1.0/A2.Length)
-                    if (A1-A2).Length <= 1e-6 or (A1+A2).Length <= 1e-6:
-                        if len(frontObj.Shape.Vertexes) == len(backObj.Shape.Vertexes) and \
-                           len(frontObj.Shape.Vertexes) > 0 and \
-                           abs(frontObj.Shape.Area) > 0 and \
-                           abs(frontObj.Shape.Area - backObj.Shape.Area)/abs(frontObj.Shape.Area) < 1e-6:
-                            self.two_d_settings['Distance'] = fShape.distToShape(bShape)[0]/1000
+                if all(isinstance(f.Surface, Part.Plane) for f in fShape.Faces) and \
+                   all(isinstance(f.Surface, Part.Plane) for f in bShape.Faces):
+                    a1 = numpy.array(tuple(fShape.Faces[0].Surface.Axis), dtype=numpy.float64)
+                    a1 /= numpy.linalg.norm(a1)
+                    a2 = numpy.array(tuple(bShape.Faces[0].Surface.Axis), dtype=numpy.float64)
+                    a2 /= numpy.linalg.norm(a2)
+                    if numpy.linalg.norm(a1-a2) <= 1e-6 or numpy.linalg.norm(a1+a2) <= 1e-6:
+                        if len(fShape.Vertexes) == len(bShape.Vertexes) and \
+                           len(fShape.Vertexes) > 0 and \
+                           abs(fShape.Area) > 0 and \
+                           abs(fShape.Area - bShape.Area)/abs(fShape.Area) < 1e-6:
+                            # Planes are known to be flat and parallel, so the gap is the normal distance
+                            # between any point on each
+                            p1 = numpy.array(tuple(fShape.Faces[0].CenterOfMass), dtype=numpy.float64)
+                            p2 = numpy.array(tuple(bShape.Faces[0].CenterOfMass), dtype=numpy.float64)
+                            self.two_d_settings['Distance'] = abs(numpy.dot(a1, p2-p1))/1000
                         else:
                             raise RuntimeError("2D bounding planes do not match up.")
                     else:
@@ -150,23 +256,22 @@ class CfdMeshTools:
                 else:
                     raise RuntimeError("2D bounding planes need to be flat surfaces.")
 
-            case = CfdCaseWriterFoam.CfdCaseWriterFoam(analysis_obj)
-            case.settings = {}
-            case.settings['createPatchesFromSnappyBaffles'] = False
-            case.setupPatchNames()
-            keys = list(case.settings['createPatches'].keys())
-
-            frontPatchIndex = keys.index(frontObj.Label)
-            self.two_d_settings['FrontFaceList'] = case.settings['createPatches'][keys[frontPatchIndex]]['PatchNamesList']
-
-            backPatchIndex = keys.index(backObj.Label)
-            self.two_d_settings['BackFaceList'] = case.settings['createPatches'][keys[backPatchIndex]]['PatchNamesList']
+            # Face names were set up on construction, so the patches can be matched without a full case writer
+            create_patches = CfdCaseWriterFoam.computePatchNames(self.getBoundaries(analysis_obj), self.mesh_obj)
+            self.two_d_settings['FrontFaceList'] = create_patches[frontObj.Label]['PatchNamesList']
+            self.two_d_settings['BackFaceList'] = create_patches[backObj.Label]['PatchNamesList']
             self.two_d_settings['BackFace'] = self.two_d_settings['BackFaceList'][0]
         else:
             self.two_d_settings['ConvertTo2D'] = False
             if len(twoDPlanes):
                 raise RuntimeError("2D bounding planes can not be used in 3D mesh")
 
+    def getBoundaries(self, analysis_obj):
+        """ Return the boundary objects of the analysis, retrieved only on first use """
+        if self.boundaries is None:
+            self.boundaries = CfdTools.getCfdBoundaryGroup(analysis_obj)
+        return self.boundaries
+
     def getClmax(self):
         return Units.Quantity(self.clmax, Units.Length)
 
@@ -202,18 +307,30 @@ class CfdMeshTools:
         """ Process mesh refinements """
         mr_objs = CfdTools.getMeshRefinementObjs(self.mesh_obj)
 
+        # Referenced objects may appear in many refinements, so look each up (with its shape) only once
+        ref_cache = {}  # { 'ObjectName' : (object, shape) }
+
+        def getReference(obj_name):
+            if obj_name not in ref_cache:
+                obj = FreeCAD.ActiveDocument.getObject(obj_name)
+                ref_cache[obj_name] = (obj, obj.Shape)
+            return ref_cache[obj_name]
+
         if self.mesh_obj.MeshUtility == "gmsh":
             # mesh regions
             self.ele_length_map = {}  # { 'ElementString' : element length }
             self.ele_node_map = {}  # { 'ElementString' : [element nodes] }
+            ele_shape_map = {}  # { 'ElementString' : element shape in the Part to mesh }
             if not mr_objs:
                 print ('  No mesh refinements')
             else:
                 print ('  Mesh refinements found - getting elements')
-                if self.part_obj.Shape.ShapeType == 'Compound':
+                if self.part_shape.ShapeType == 'Compound':
                     # see http://forum.freecadweb.org/viewtopic.php?f=18&t=18780&start=40#p149467 and http://forum.freecadweb.org/viewtopic.php?f=18&t=18780&p=149520#p149520
                     err = "GMSH could return unexpected meshes for a boolean split tools Compound. It is strongly recommended to extract the shape to mesh from the Compound and use this one."
                     FreeCAD.Console.PrintError(err + "\n")
+                # Centres of the elements of the part, found while searching it for the references
+                part_centres = {}
                 for mr_obj in mr_objs:
                     if mr_obj.RelativeLength:
                         if mr_obj.References:
@@ -221,14 +338,14 @@ class CfdMeshTools:
                                 # Check if the shape of the mesh region is an element of the Part to mesh;
                                 # if not try to find the element in the shape to mesh
                                 search_ele_in_shape_to_mesh = False
-                                ref = FreeCAD.ActiveDocument.getObject(sub[0])
-                                if not self.part_obj.Shape.isSame(ref.Shape):
+                                ref, ref_shape = getReference(sub[0])
+                                if not self.part_shape.isSame(ref_shape):
                                     search_ele_in_shape_to_mesh = True
                                 elems = sub[1]
                                 if search_ele_in_shape_to_mesh:
                                     # Try to find the element in the Shape to mesh
                                     ele_shape = FemMeshTools.get_element(ref, elems)  # the method getElement(element) does not return Solid elements
-                                    found_element = CfdTools.findElementInShape(self.part_obj.Shape, ele_shape)
+                                    found_element = CfdTools.findElementInShape(self.part_shape, ele_shape, part_centres)
                                     if found_element:
                                         elems = found_element
                                     else:
@@ -245,6 +362,7 @@ class CfdMeshTools:
                                             mr_rellen = 0.01  # Relative length should not be less than 1/100 of base length
                                             FreeCAD.Console.PrintError("The meshregion: " + mr_obj.Name + " should not use a relative length smaller than 0.01.\n")
                                         self.ele_length_map[elems] = mr_rellen*self.clmax
+                                        ele_shape_map[elems] = FemMeshTools.get_element(self.part_obj, elems)
                                     else:
                                         FreeCAD.Console.PrintError("The element " + elems + " of the mesh refinement " + mr_obj.Name + " has been added to another mesh refinement.\n")
                         else:
@@ -252,11 +370,16 @@ class CfdMeshTools:
                     else:
                         FreeCAD.Console.PrintError("The meshregion: " + mr_obj.Name + " is not used to create the mesh because the CharacteristicLength is 0.0 mm.\n")
                 for eleml in self.ele_length_map:
-                    ele_shape = FemMeshTools.get_element(self.part_obj, eleml)  # the method getElement(element) does not return Solid elements
-                    ele_vertexes = FemMeshTools.get_vertexes_by_element(self.part_obj.Shape, ele_shape)
+                    ele_shape = ele_shape_map[eleml]
+                    ele_vertexes = FemMeshTools.get_vertexes_by_element(self.part_shape, ele_shape)
                     self.ele_node_map[eleml] = ele_vertexes
 
         else:
+            # Properties are re-read from the document object on every access, so fetch them once for the loops
+            mesh_utility = self.mesh_obj.MeshUtility
+            shape_face_names = self.mesh_obj.ShapeFaceNames
+            scale = self.scale
+
             cf_settings = self.cf_settings
             cf_settings['MeshRegions'] = {}
             cf_settings['BoundaryLayers'] = {}
@@ -265,7 +388,6 @@ class CfdMeshTools:
             snappy_settings['MeshRegions'] = {}
             snappy_settings['InternalRegions'] = {}
 
-            from collections import defaultdict
             ele_meshpatch_map = defaultdict(list)
             if not mr_objs:
                 print('  No mesh refinement')
@@ -277,7 +399,7 @@ class CfdMeshTools:
 
                 # Make list of list of all references for their corresponding mesh object
                 bl_matched_faces = []
-                if self.mesh_obj.MeshUtility == 'cfMesh':
+                if mesh_utility == 'cfMesh':
                     region_face_lists = []
                     for mr_id, mr_obj in enumerate(mr_objs):
                         region_face_lists.append([])
@@ -285,7 +407,33 @@ class CfdMeshTools:
                             refs = mr_obj.References
                             for r in refs:
                                 region_face_lists[mr_id].append(r)
-                    bl_matched_faces = CfdTools.matchFacesToTargetShape(region_face_lists, self.mesh_obj.Part.Shape)
+                    bl_matched_faces = CfdTools.matchFacesToTargetShape(region_face_lists, self.part_shape)
+                # Indices of the matched part faces for each region
+                bl_region_faces = defaultdict(list)
+                for (i, mf) in enumerate(bl_matched_faces):
+                    for (nb, bref) in mf:
+                        bl_region_faces[nb].append(i)
+
+                # Look up the referenced elements of each region, then triangulate and write the region surfaces
+                region_elements = {}  # { mr_id : [(reference name, element name, element shape)] }
+                for mr_id, mr_obj in enumerate(mr_objs):
+                    if mr_obj.RelativeLength:
+                        region_elements[mr_id] = []
+                        for sub in mr_obj.References:
+                            shape = getReference(sub[0])[1]
+                            elem = sub[1]
+                            if elem.startswith('Solid'):  # getElement doesn't work with solids for some reason
+                                elt = shape.Solids[int(elem[len('Solid'):])-1]
+                            else:
+                                elt = shape.getElement(elem)
+                            if elt.ShapeType == 'Face' or elt.ShapeType == 'Solid':
+                                region_elements[mr_id].append((sub[0], elem, elt))
+                linear_deflection = self.mesh_obj.STLLinearDeflection
+                region_baffles = {}
+                for mr_id in sorted(region_elements):
+                    region_baffles[mr_id] = self.writeRegionSurfaces(
+                        mr_objs[mr_id].Name, region_elements[mr_id],
+                        mesh_utility == 'snappyHexMesh' and mr_objs[mr_id].Baffle, linear_deflection)
 
                 for mr_id, mr_obj in enumerate(mr_objs):
                     Internal = mr_obj.Internal
@@ -304,77 +452,38 @@ class CfdMeshTools:
                                 "The meshregion: {} should not use a relative length smaller "
                                 "than 0.001.\n".format(mr_obj.Name))
 
-                        tri_surface = ""
-                        snappy_mesh_region_list = []
+                        snappy_mesh_region_list = list(region_baffles[mr_id])
                         patch_list = []
-                        for (si, sub) in enumerate(mr_obj.References):
-                            shape = FreeCAD.ActiveDocument.getObject(sub[0]).Shape
-                            elem = sub[1]
-                            if elem.startswith('Solid'):  # getElement doesn't work with solids for some reason
-                                elt = shape.Solids[int(elem.lstrip('Solid'))-1]
-                            else:
-                                elt = shape.getElement(elem)
-                            if elt.ShapeType == 'Face' or elt.ShapeType == 'Solid':
-                                facemesh = MeshPart.meshFromShape(elt,
-                                                                  LinearDeflection=self.mesh_obj.STLLinearDeflection)
-
-                                tri_surface += "solid {}{}{}\n".format(mr_obj.Name, sub[0], elem)
-                                for face in facemesh.Facets:
-                                    tri_surface += " facet normal 0 0 0\n"
-                                    tri_surface += "  outer loop\n"
-                                    for i in range(3):
-                                        p = [i * self.scale for i in face.Points[i]]
-                                        tri_surface += "    vertex {} {} {}\n".format(p[0], p[1], p[2])
-                                    tri_surface += "  endloop\n"
-                                    tri_surface += " endfacet\n"
-                                tri_surface += "endsolid {}{}{}\n".format(mr_obj.Name, sub[0], elem)
-
-                                if self.mesh_obj.MeshUtility == 'snappyHexMesh' and mr_obj.Baffle:
-                                    # Save baffle references or faces individually
-                                    baffle = "{}{}{}".format(mr_obj.Name, sub[0], elem)
-                                    fid = open(os.path.join(self.triSurfaceDir, baffle + ".stl"), 'w')
-                                    fid.write(tri_surface)
-                                    fid.close()
-                                    tri_surface = ""
-                                    snappy_mesh_region_list.append(baffle)
-
-                        if self.mesh_obj.MeshUtility == 'cfMesh' or not mr_obj.Baffle:
-                            fid = open(os.path.join(self.triSurfaceDir, mr_obj.Name + '.stl'), 'w')
-                            fid.write(tri_surface)
-                            fid.close()
-
-                        if self.mesh_obj.MeshUtility == 'cfMesh' and mr_obj.NumberLayers > 1 and not Internal:
-                            for (i, mf) in enumerate(bl_matched_faces):
-                                for j in range(len(mf)):
-                                    if mr_id == mf[j][0]:
-                                        sfN = self.mesh_obj.ShapeFaceNames[i]
-                                        ele_meshpatch_map[mr_obj.Name].append(sfN)
-                                        patch_list.append(sfN)
-
-                                        # Limit expansion ratio to greater than 1.0 and less than 1.2
-                                        expratio = mr_obj.ExpansionRatio
-                                        expratio = min(1.2, max(1.0, expratio))
-
-                                        cf_settings['BoundaryLayers'][self.mesh_obj.ShapeFaceNames[i]] = {
-                                            'NumberLayers': mr_obj.NumberLayers,
-                                            'ExpansionRatio': expratio,
-                                            'FirstLayerHeight': self.scale *
-                                                                Units.Quantity(mr_obj.FirstLayerHeight).Value
-                                        }
-
-                        if self.mesh_obj.MeshUtility == 'cfMesh':
+
+                        if mesh_utility == 'cfMesh' and mr_obj.NumberLayers > 1 and not Internal:
+                            for i in bl_region_faces[mr_id]:
+                                sfN = shape_face_names[i]
+                                ele_meshpatch_map[mr_obj.Name].append(sfN)
+                                patch_list.append(sfN)
+
+                                # Limit expansion ratio to greater than 1.0 and less than 1.2
+                                expratio = mr_obj.ExpansionRatio
+                                expratio = min(1.2, max(1.0, expratio))
+
+                                cf_settings['BoundaryLayers'][shape_face_names[i]] = {
+                                    'NumberLayers': mr_obj.NumberLayers,
+                                    'ExpansionRatio': expratio,
+                                    'FirstLayerHeight': scale * Units.Quantity(mr_obj.FirstLayerHeight).Value
+                                }
+
+                        if mesh_utility == 'cfMesh':
                             if not Internal:
                                 cf_settings['MeshRegions'][mr_obj.Name] = {
-                                    'RelativeLength': mr_rellen * self.clmax * self.scale,
-                                    'RefinementThickness': self.scale * Units.Quantity(
+                                    'RelativeLength': mr_rellen * self.clmax * scale,
+                                    'RefinementThickness': scale * Units.Quantity(
                                         mr_obj.RefinementThickness).Value,
                                 }
                             else:
                                 cf_settings['InternalRegions'][mr_obj.Name] = {
-                                    'RelativeLength': mr_rellen * self.clmax * self.scale
+                                    'RelativeLength': mr_rellen * self.clmax * scale
                                 }
 
-                        elif self.mesh_obj.MeshUtility == 'snappyHexMesh':
+                        elif mesh_utility == 'snappyHexMesh':
                             refinement_level = CfdTools.relLenToRefinementLevel(mr_obj.RelativeLength)
                             if not Internal:
                                 if not mr_obj.Baffle:
@@ -399,14 +508,45 @@ class CfdMeshTools:
                             "The meshregion: " + mr_obj.Name + " is not used to create the mesh because the "
                             "CharacteristicLength is 0.0 mm or the reference list is empty.\n")
 
+    def writeRegionSurfaces(self, region_name, elements, split_baffles, linear_deflection):
+        """ Triangulate the referenced elements of a mesh refinement and write them to the triSurface directory,
+        either as one surface for the region or, for snappyHexMesh baffles, one surface per reference. Returns the names
+        of the baffle surfaces. """
+        tri_surface = []
+        baffles = []
+        for (obj_name, elem, elt) in elements:
+            solid_name = "{}{}{}".format(region_name, obj_name, elem)
+            tri_surface.append((solid_name, facetPoints(self.meshShape(elt, linear_deflection), self.scale)))
+
+            if split_baffles:
+                # Save baffle references or faces individually
+                writeStl(os.path.join(self.triSurfaceDir, solid_name + ".stl"), tri_surface)
+                tri_surface = []
+                baffles.append(solid_name)
+
+        if not split_baffles:
+            writeStl(os.path.join(self.triSurfaceDir, region_name + '.stl'), tri_surface)
+        return baffles
+
+    def meshShape(self, shape, linear_deflection):
+        """ Triangulate a shape for STL output, re-using the result if the same shape has already been meshed """
+        # The hash is not unique, and orientation decides the winding of the triangles, so confirm any hit
+        entries = self.mesh_cache.setdefault((shape.hashCode(), linear_deflection), [])
+        for (cached_shape, mesh) in entries:
+            if cached_shape.isSame(shape) and cached_shape.Orientation == shape.Orientation:
+                return mesh
+        mesh = MeshPart.meshFromShape(shape, LinearDeflection=linear_deflection)
+        entries.append((shape, mesh))
+        return mesh
+
     def automaticInsidePointDetect(self):
         # Snappy requires that the chosen internal point must remain internal during the meshing process and therefore
         # the meshing algorithm might fail if the point accidentally in a sliver fall between the mesh and the geometry.
         # As a safety measure, the check distance is chosen to be approximately the size of the background mesh.
-        shape = self.part_obj.Shape
+        shape = self.part_shape
         step_size = self.clmax*2.5
 
-        bound_box = self.part_obj.Shape.BoundBox
+        bound_box = self.part_bound_box
         error_safety_factor = 2.0
         if (step_size*error_safety_factor >= bound_box.XLength or
                         step_size*error_safety_factor >= bound_box.YLength or
@@ -419,55 +559,53 @@ class CfdMeshTools:
         y2 = bound_box.YMax
         z1 = bound_box.ZMin
         z2 = bound_box.ZMax
-        import random
+
+        # Try a limited number of points of increasingly fine grids, down to cells of roughly the check distance in
+        # size, from the centre outward. The points are only generated as they are tried.
+        lengths = (bound_box.XLength, bound_box.YLength, bound_box.ZLength)
+        counts = [max(1, min(INSIDE_POINT_GRID_MAX, int(length/step_size))) for length in lengths]
+        candidates = itertools.islice(gridCandidates((x1, y1, z1), lengths, counts), INSIDE_POINT_GRID_CHECKS)
+        isInside = shape.isInside
+        for (x, y, z) in candidates:
+            pointCheck = FreeCAD.Vector(x, y, z)
+            if isInside(pointCheck, step_size, False):
+                return pointCheck
+
+        # Fall back to random sampling if no grid point tried is far enough inside
         while 1:
             x = random.uniform(x1,x2)
             y = random.uniform(y1,y2)
             z = random.uniform(z1,z2)
             pointCheck = FreeCAD.Vector(x,y,z)
-            result = shape.isInside(pointCheck,step_size,False)
+            result = isInside(pointCheck,step_size,False)
             if result:
                 return pointCheck
 
     def writePartFile(self):
         """ Construct multi-element STL based on mesh part faces. """
         if self.mesh_obj.MeshUtility == "gmsh":
-            self.part_obj.Shape.exportBrep(self.temp_file_shape)
+            self.part_shape.exportBrep(self.temp_file_shape)
         else:
             if ("Boolean" in self.part_obj.Name) and self.mesh_obj.MeshUtility:
                 FreeCAD.Console.PrintError('cfMesh and snappyHexMesh do not accept boolean fragments.')
 
-            with open(self.temp_file_geo, 'w') as fullMeshFile:
-                for (i, objFaces) in enumerate(self.part_obj.Shape.Faces):
-                    faceName = ("face{}".format(i))
-                    mesh_stl = MeshPart.meshFromShape(objFaces, LinearDeflection=self.mesh_obj.STLLinearDeflection)
-                    fullMeshFile.write("solid {}\n".format(faceName))
-                    for face in mesh_stl.Facets:
-                        n = face.Normal
-                        fullMeshFile.write(" facet normal {} {} {}\n".format(n[0], n[1], n[2]))
-                        fullMeshFile.write("  outer loop\n")
-                        for j in range(3):
-                            p = face.Points[j]
-                            fullMeshFile.write("    vertex {} {} {}".format(self.scale*p[0],
-                                                                            self.scale*p[1],
-                                                                            self.scale*p[2]))
-                            fullMeshFile.write("\n")
-                        fullMeshFile.write("  endloop\n")
-                        fullMeshFile.write(" endfacet\n")
-                    fullMeshFile.write("endsolid {}\n".format(faceName))
+            # Faces are triangulated one at a time: neighbouring faces share edges, on which OCC stores the
+            # triangulation, so meshing them concurrently is not safe
+            linear_deflection = self.mesh_obj.STLLinearDeflection
+            scale = self.scale
+            with open(self.temp_file_geo, 'w', buffering=STL_WRITE_BUFFER_SIZE) as fullMeshFile:
+                for (i, face) in enumerate(self.part_faces):
+                    mesh_stl = self.meshShape(face, linear_deflection)
+                    writeStlSolid(fullMeshFile, "face{}".format(i), facetPoints(mesh_stl, scale))
 
     def loadSurfMesh(self):
         if not self.error:
             # NOTE: FemMesh does not support multi element stl
             # fem_mesh = Fem.read(os.path.join(self.meshCaseDir,'mesh_outside.stl'))
-            # This is a temp work around to remove multiple solids, but is not very efficient
-            import Mesh
+            # Work around this by reading it in and writing it back in place as a single ASCII solid
             stl = os.path.join(self.meshCaseDir, 'mesh_outside.stl')
-            ast = os.path.join(self.meshCaseDir, 'mesh_outside.ast')
             mesh = Mesh.Mesh(stl)
-            mesh.write(ast)
-            os.remove(stl)
-            os.rename(ast, stl)
+            mesh.write(stl, "AST")
             fem_mesh = Fem.read(stl)
             fem_mesh_obj = FreeCAD.ActiveDocument.addObject("Fem::FemMeshObject", self.mesh_obj.Name+"_Surf_Vis")
             fem_mesh_obj.FemMesh = fem_mesh
@@ -493,7 +631,7 @@ class CfdMeshTools:
                 self.cf_settings['InternalRefinementRegionsPresent'] = False
 
         elif self.mesh_obj.MeshUtility == "snappyHexMesh":
-            bound_box = self.part_obj.Shape.BoundBox
+            bound_box = self.part_bound_box
             bC = 5  # Number of background mesh buffer cells
             x_min = (bound_box.XMin - bC*self.clmax)*self.scale
             x_max = (bound_box.XMax + bC*self.clmax)*self.scale
@@ -522,10 +660,7 @@ class CfdMeshTools:
             inside_y = Units.Quantity(self.mesh_obj.PointInMesh.get('y')).Value*self.scale
             inside_z = Units.Quantity(self.mesh_obj.PointInMesh.get('z')).Value*self.scale
 
-            shape_face_names_list = []
-            for i in self.mesh_obj.ShapeFaceNames:
-                shape_face_names_list.append(i)
-            snappy_settings['ShapeFaceNames'] = tuple(shape_face_names_list)
+            snappy_settings['ShapeFaceNames'] = tuple(self.mesh_obj.ShapeFaceNames)
             snappy_settings['EdgeRefinementLevel'] = CfdTools.relLenToRefinementLevel(self.mesh_obj.EdgeRefinement)
             snappy_settings['PointInMesh'] = {
                 "x": inside_x,
@@ -545,44 +680,35 @@ class CfdMeshTools:
             else:
                 self.snappy_settings['InternalRefinementRegionsPresent'] = False
         elif self.mesh_obj.MeshUtility == "gmsh":
-            if platform.system() == "Windows":
-                exe = os.path.join(FreeCAD.getHomePath(), 'bin', 'gmsh.exe')
-            else:
-                exe = subprocess.check_output(["which", "gmsh"], universal_newlines=True).rstrip('\n')
-            self.gmsh_settings['Executable'] = CfdTools.translatePath(exe)
+            self.gmsh_settings['Executable'] = CfdTools.translatePath(getGmshExecutable())
             self.gmsh_settings['ShapeFile'] = self.temp_file_shape
             self.gmsh_settings['HasLengthMap'] = False
             if self.ele_length_map:
                 self.gmsh_settings['HasLengthMap'] = True
                 self.gmsh_settings['LengthMap'] = self.ele_length_map
-                self.gmsh_settings['NodeMap'] = {}
-                for e in self.ele_length_map:
-                    ele_nodes = (''.join((str(n+1) + ', ') for n in self.ele_node_map[e])).rstrip(', ')
-                    self.gmsh_settings['NodeMap'][e] = ele_nodes
+                # Offset to gmsh's one-based node numbering in numpy and format with the C-level map/str
+                self.gmsh_settings['NodeMap'] = {
+                    e: ', '.join(map(str, (numpy.asarray(self.ele_node_map[e], dtype=int) + 1).tolist()))
+                    for e in self.ele_length_map}
             self.gmsh_settings['ClMax'] = self.clmax
             self.gmsh_settings['ClMin'] = self.clmin
-            sols = (''.join((str(n+1) + ', ') for n in range(len(self.mesh_obj.Part.Shape.Solids)))).rstrip(', ')
-            self.gmsh_settings['Solids'] = sols
-            self.gmsh_settings['BoundaryFaceMap'] = {}
+            self.gmsh_settings['Solids'] = ', '.join(map(str, range(1, len(self.part_shape.Solids)+1)))
             # Write one boundary per face
-            for i in range(len(self.mesh_obj.Part.Shape.Faces)):
-                self.gmsh_settings['BoundaryFaceMap']['face'+str(i)] = i+1
+            self.gmsh_settings['BoundaryFaceMap'] = {'face'+str(i): i+1 for i in range(len(self.part_faces))}
             self.gmsh_settings['MeshFile'] = self.temp_file_mesh
 
-        # Perform initialisation here rather than __init__ in case of path changes
-        self.template_path = os.path.join(CfdTools.get_module_path(), "data", "defaultsMesh")
+        self.template_path = MESH_TEMPLATE_PATH
 
-        mesh_region_present = False
-        if self.mesh_obj.MeshUtility == "cfMesh" and len(self.cf_settings['MeshRegions']) > 0 or \
-           self.mesh_obj.MeshUtility == "snappyHexMesh" and len(self.snappy_settings['MeshRegions']) > 0:
-            mesh_region_present = True
+        mesh_utility = self.mesh_obj.MeshUtility
+        utility_settings = {'cfMesh': self.cf_settings, 'snappyHexMesh': self.snappy_settings}.get(mesh_utility)
+        mesh_region_present = bool(utility_settings and utility_settings.get('MeshRegions'))
 
         self.settings = {
             'Name': self.part_obj.Name,
             'MeshPath': self.meshCaseDir,
             'FoamRuntime': CfdTools.getFoamRuntime(),
             'TranslatedFoamPath': CfdTools.translatePath(CfdTools.getFoamDir()),
-            'MeshUtility': self.mesh_obj.MeshUtility,
+            'MeshUtility': mesh_utility,
             'MeshRegionPresent': mesh_region_present,
             'CfSettings': self.cf_settings,
             'SnappySettings': self.snappy_settings,
@@ -590,12 +716,7 @@ class CfdMeshTools:
             'TwoDSettings': self.two_d_settings
         }
 
-        TemplateBuilder.TemplateBuilder(self.meshCaseDir, self.template_path, self.settings)
-
-        # Update Allmesh permission - will fail silently on Windows
-        fname = os.path.join(self.meshCaseDir, "Allmesh")
-        import stat
-        s = os.stat(fname)
-        os.chmod(fname, s.st_mode | stat.S_IEXEC)
+        TemplateBuilder.TemplateBuilder(self.meshCaseDir, self.template_path, self.settings,
+                                        executable_files=["Allmesh"])
 
         FreeCAD.Console.PrintMessage("Successfully wrote meshCase to folder {}\n".format(self.meshCaseDir))
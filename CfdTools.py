@@ -36,13 +36,20 @@ import Part
 import os
 import os.path
 import shutil
+try:
+    from shutil import which
+except ImportError:  # Python 2
+    from distutils.spawn import find_executable as which
 import tempfile
 import string
 import numbers
 import platform
+import re
 import subprocess
 import sys
 import math
+import time
+import numpy
 if FreeCAD.GuiUp:
     import FreeCADGui
     from PySide import QtGui
@@ -58,6 +65,42 @@ FOAM_DIR_DEFAULTS = {"Windows": ["C:\\Program Files\\blueCFD-Core-2017\\OpenFOAM
                                "~/OpenFOAM/OpenFOAM-dev"]
                      }
 
+# Default install locations for this platform, with the user directory expanded
+FOAM_DIR_DEFAULTS_EXPANDED = tuple(os.path.expanduser(d) for d in FOAM_DIR_DEFAULTS.get(platform.system(), []))
+
+# The module location and the platform do not change while running, so only determine them once
+MODULE_PATH = os.path.dirname(__file__)
+FOAM_RUNTIME = 'BlueCFD' if platform.system() == 'Windows' else 'Posix'
+
+# Validated OpenFOAM installation directory for each value of the InstallationPath preference
+FOAM_DIR_CACHE = {}
+
+# Windows short path names already looked up
+SHORT_PATH_CACHE = {}
+
+# Compiled readTemplate placeholder patterns for each set of replacement keys
+TEMPLATE_PATTERN_CACHE = {}
+
+# Location of executables already found, for each (command, PATH)
+EXECUTABLE_CACHE = {}
+
+# Output of 'gmsh -version' for each value of PATH for which it ran successfully
+GMSH_VERSION_CACHE = {}
+
+# Name of the analysis object last found or made active, for each document
+ACTIVE_ANALYSIS_CACHE = {}
+
+# Tolerances used by floatEqual
+FLOAT_EQUAL_RELTOL = 10*sys.float_info.epsilon
+FLOAT_EQUAL_ABSTOL = 1e-12  # Seems to be necessary on file read/write
+
+# Largest number of vertex pairs verticesCoincide compares in one broadcast before switching to a banded search
+VERTEX_BROADCAST_LIMIT = 4096
+
+# Minimum interval (s) between GUI refreshes from cfdMessage, and the time of the last one
+GUI_UPDATE_INTERVAL = 0.1
+LAST_GUI_UPDATE = 0.0
+
 
 def getDefaultOutputPath():
     prefs = getPreferencesLocation()
@@ -101,35 +144,68 @@ def getParentAnalysisObject(obj):
     #return None
 
 
-def getPhysicsModel(analysis_object):
-    isPresent = False
+def classifyAnalysisGroup(analysis_object):
+    """ Sort the members of the analysis into the objects returned by the individual get functions below, walking
+    the group only once. Intended for callers that need most of them. """
+    from CfdMesh import _CfdMesh
+    from CfdSolverFoam import _CfdSolverFoam
+    from CfdFluidBoundary import _CfdFluidBoundary
+    from CfdInitialiseFlowField import _CfdInitialVariables
+    members = {'PhysicsModel': None,
+               'Mesh': None,
+               'Solver': None,
+               'InitialConditions': None,
+               'Result': None,
+               'Materials': [],
+               'BoundaryGroup': [],
+               'PorousZones': [],
+               'InitialisationZones': [],
+               'Zones': []}
     for i in analysis_object.Group:
-        if "PhysicsModel" in i.Name:
-            physicsModel = i
-            isPresent = True
-    if not isPresent:
-        physicsModel = None
-    return physicsModel
+        name = i.Name
+        if "PhysicsModel" in name:
+            if members['PhysicsModel'] is None:
+                members['PhysicsModel'] = i
+        if 'Zone' in name:
+            members['Zones'].append(i)
+            if name.startswith('PorousZone'):
+                members['PorousZones'].append(i)
+            elif name.startswith('InitialisationZone'):
+                members['InitialisationZones'].append(i)
+        if i.isDerivedFrom('App::MaterialObjectPython'):
+            members['Materials'].append(i)
+        elif i.isDerivedFrom("Fem::FemResultObject"):
+            if members['Result'] is None:
+                members['Result'] = i
+        proxy = getattr(i, "Proxy", None)
+        if isinstance(proxy, _CfdFluidBoundary):
+            members['BoundaryGroup'].append(i)
+        elif isinstance(proxy, _CfdMesh):
+            if members['Mesh'] is None:
+                members['Mesh'] = i
+        elif isinstance(proxy, _CfdSolverFoam):
+            if members['Solver'] is None:
+                members['Solver'] = i
+        elif isinstance(proxy, _CfdInitialVariables):
+            if members['InitialConditions'] is None:
+                members['InitialConditions'] = i
+    return members
+
+
+def getPhysicsModel(analysis_object):
+    return next((i for i in analysis_object.Group if "PhysicsModel" in i.Name), None)
 
 
 def getMeshObject(analysis_object):
-    isPresent = False
-    meshObj = []
     if analysis_object:
         members = analysis_object.Group
     else:
         members = FreeCAD.activeDocument().Objects
     from CfdMesh import _CfdMesh
-    for i in members:
-        if hasattr(i, "Proxy") and isinstance(i.Proxy, _CfdMesh):
-            if isPresent:
-                FreeCAD.Console.PrintError("Analysis contains more than one mesh object.")
-            else:
-                meshObj.append(i)
-                isPresent = True
-    if not isPresent:
-        meshObj = [None]
-    return meshObj[0]
+    meshObj = [i for i in members if isinstance(getattr(i, "Proxy", None), _CfdMesh)]
+    if len(meshObj) > 1:
+        FreeCAD.Console.PrintError("Analysis contains more than one mesh object.")
+    return meshObj[0] if meshObj else None
 
 
 def getPorousZoneObjects(analysis_object):
@@ -166,11 +242,8 @@ def getSolver(analysis_object):
 
 def getSolverSettings(solver):
     """ Convert properties into python dict, while key must begin with lower letter. """
-    dict = {}
-    f = lambda s: s[0].lower() + s[1:]
-    for prop in solver.PropertiesList:
-        dict[f(prop)] = solver.getPropertyByName(prop)
-    return dict
+    getPropertyByName = solver.getPropertyByName
+    return {prop[0].lower() + prop[1:]: getPropertyByName(prop) for prop in solver.PropertiesList}
 
 
 def getCfdBoundaryGroup(analysis_object):
@@ -184,15 +257,15 @@ def getCfdBoundaryGroup(analysis_object):
 
 def is_planar(shape):
     """ Return whether the shape is a planar face """
-    n = shape.normalAt(0.5, 0.5)
-    if len(shape.Vertexes) <= 3:
+    vertexes = shape.Vertexes
+    if len(vertexes) <= 3:
         return True
-    for v in shape.Vertexes[1:]:
-        t = v.Point - shape.Vertexes[0].Point
-        c = t.dot(n)
-        if c / t.Length > 1e-8:
-            return False
-    return True
+    n = numpy.array(shape.normalAt(0.5, 0.5))
+    pts = numpy.array([v.Point for v in vertexes])
+    # Normalised out-of-plane component of the vector from the first vertex to each of the others
+    t = pts[1:] - pts[0]
+    lengths = numpy.maximum(numpy.linalg.norm(t, axis=1), 1e-300)
+    return not numpy.any(numpy.abs(t.dot(n))/lengths > 1e-8)
 
 
 def getMesh(analysis_object):
@@ -205,11 +278,7 @@ def getMesh(analysis_object):
 
 def getMeshRefinementObjs(mesh_obj):
     from CfdMeshRefinement import _CfdMeshRefinement
-    ref_objs = []
-    for obj in mesh_obj.Group:
-        if hasattr(obj, "Proxy") and isinstance(obj.Proxy, _CfdMeshRefinement):
-            ref_objs = ref_objs + [obj]
-    return ref_objs
+    return [obj for obj in mesh_obj.Group if isinstance(getattr(obj, "Proxy", None), _CfdMeshRefinement)]
 
 
 def getResult(analysis_object):
@@ -225,7 +294,7 @@ def get_module_path():
     the module is installed in the app's module directory or the user's app data folder.
     (The second overrides the first.)
     """
-    return os.path.dirname(__file__)
+    return MODULE_PATH
 
 
 # Set functions
@@ -240,12 +309,11 @@ def setCompSolid(vobj):
 
 
 def normalise(v):
-    import numpy
-    mag = numpy.sqrt(sum(vi**2 for vi in v))
-    import sys
+    v = numpy.asarray(v, dtype=float)
+    mag = numpy.linalg.norm(v)
     if mag < sys.float_info.min:
         mag += sys.float_info.min
-    return [vi/mag for vi in v]
+    return (v/mag).tolist()
 
 
 def cfdError(msg):
@@ -258,10 +326,14 @@ def cfdError(msg):
 
 
 def cfdMessage(msg):
-    """ Print a message to console and refresh GUI """
+    """ Print a message to console and refresh GUI, at most once every GUI_UPDATE_INTERVAL """
+    global LAST_GUI_UPDATE
     FreeCAD.Console.PrintMessage(msg)
     if FreeCAD.GuiUp:
-        FreeCAD.Gui.updateGui()
+        now = time.time()
+        if not 0 <= now - LAST_GUI_UPDATE < GUI_UPDATE_INTERVAL:
+            FreeCAD.Gui.updateGui()
+            LAST_GUI_UPDATE = now
 
 
 def setQuantity(inputField, quantity):
@@ -304,37 +376,43 @@ def hide_parts_show_meshes():
 
 
 def copyFilesRec(src, dst, symlinks=False, ignore=None):
-    """ Recursively copy files from src dir to dst dir """
+    """ Recursively copy files from src dir to dst dir, which may already exist """
+    if sys.version_info >= (3, 8):
+        shutil.copytree(src, dst, symlinks=symlinks, ignore=ignore, dirs_exist_ok=True)
+        return
     if not os.path.exists(dst):
         os.makedirs(dst)
-    for item in os.listdir(src):
+    items = os.listdir(src)
+    ignored = ignore(src, items) if ignore else ()
+    for item in items:
+        if item in ignored:
+            continue
         s = os.path.join(src, item)
         d = os.path.join(dst, item)
-        if not os.path.isdir(s):
+        if symlinks and os.path.islink(s):
+            os.symlink(os.readlink(s), d)
+        elif os.path.isdir(s):
+            copyFilesRec(s, d, symlinks, ignore)
+        else:
             shutil.copy2(s, d)
 
 
+# OpenFOAM patch type for each boundary condition type, and for each sub-type of constraint conditions. Anything
+# not listed is a generic patch.
+PATCH_TYPES = {'wall': 'wall',
+               'empty': 'empty'}
+CONSTRAINT_PATCH_TYPES = {'symmetry': 'symmetry',
+                          'cyclic': 'cyclic',
+                          'wedge': 'wedge',
+                          'twoDBoundingPlane': 'empty',
+                          'empty': 'empty'}
+
+
 def getPatchType(bcType, bcSubType):
     """ Get the boundary type based on selected BC condition """
-    if bcType == 'wall':
-        return 'wall'
-    elif bcType == 'empty':
-        return 'empty'
-    elif bcType == 'constraint':
-        if bcSubType == 'symmetry':
-            return 'symmetry'
-        elif bcSubType == 'cyclic':
-            return 'cyclic'
-        elif bcSubType == 'wedge':
-            return 'wedge'
-        elif bcSubType == 'twoDBoundingPlane':
-            return 'empty'
-        elif bcSubType == 'empty':
-            return 'empty'
-        else:
-            return 'patch'
-    else:
-        return 'patch'
+    if bcType == 'constraint':
+        return CONSTRAINT_PATCH_TYPES.get(bcSubType, 'patch')
+    return PATCH_TYPES.get(bcType, 'patch')
 
 
 def movePolyMesh(case):
@@ -356,12 +434,17 @@ def setFoamDir(installation_path):
     prefs = getPreferencesLocation()
     # Set OpenFOAM install path in parameters
     FreeCAD.ParamGet(prefs).SetString("InstallationPath", installation_path)
+    # Re-validate (or re-detect) on next use
+    FOAM_DIR_CACHE.clear()
 
 
 def getFoamDir():
     prefs = getPreferencesLocation()
     # Get OpenFOAM install path from parameters
     installation_path = FreeCAD.ParamGet(prefs).GetString("InstallationPath", "")
+    if installation_path in FOAM_DIR_CACHE:
+        return FOAM_DIR_CACHE[installation_path]
+    pref_installation_path = installation_path
     # Ensure parameters exist for future editing
     setFoamDir(installation_path)
 
@@ -375,17 +458,14 @@ def getFoamDir():
     if not installation_path:
         raise IOError("OpenFOAM installation path not set and not found")
 
+    FOAM_DIR_CACHE[pref_installation_path] = installation_path
     return installation_path
 
 
 def getFoamRuntime():
-    if platform.system() == 'Windows':
-        #if os.path.exists(os.path.join(getFoamDir(), "..", "msys64")):
-        return 'BlueCFD'  # Not set yet...
-        #else:
-        #    return 'BashWSL'
-    else:
-        return 'Posix'
+    # On Windows, BlueCFD is assumed (BashWSL not set yet...)
+    #if os.path.exists(os.path.join(getFoamDir(), "..", "msys64")):
+    return FOAM_RUNTIME
 
 
 def detectFoamDir():
@@ -402,41 +482,35 @@ def detectFoamDir():
             foam_dir = None
 
     if not foam_dir:
-        for d in FOAM_DIR_DEFAULTS[platform.system()]:
-            foam_dir = os.path.expanduser(d)
-            if foam_dir and not os.path.exists(os.path.join(foam_dir, "etc", "bashrc")):
-                foam_dir = None
-            else:
-                break
+        for d in FOAM_DIR_DEFAULTS_EXPANDED:
+            if os.path.exists(os.path.join(d, "etc", "bashrc")):
+                return d
     return foam_dir
 
 
 def translatePath(p):
-    """ Transform path to the perspective of the Linux subsystem in which OpenFOAM is run (e.g. mingw) """
-    if platform.system() == 'Windows':
-        return fromWindowsPath(p)
-    else:
-        return p
+    """ Transform path to the perspective of the Linux subsystem in which OpenFOAM is run (e.g. mingw).
+        Nothing is needed unless running on Windows, where this is replaced by fromWindowsPath below """
+    return p
 
 
 def reverseTranslatePath(p):
-    """ Transform path from the perspective of the OpenFOAM subsystem to the host system """
-    if platform.system() == 'Windows':
-        return toWindowsPath(p)
-    else:
-        return p
+    """ Transform path from the perspective of the OpenFOAM subsystem to the host system.
+        Nothing is needed unless running on Windows, where this is replaced by toWindowsPath below """
+    return p
 
 
 def fromWindowsPath(p):
     drive, tail = os.path.splitdrive(p)
     pp = tail.replace('\\', '/')
-    if getFoamRuntime() == "BashWSL":
+    runtime = getFoamRuntime()
+    if runtime == "BashWSL":
         # bash on windows: C:\Path -> /mnt/c/Path
         if os.path.isabs(p):
             return "/mnt/" + (drive[:-1]).lower() + pp
         else:
             return pp
-    elif getFoamRuntime() == "BlueCFD":
+    elif runtime == "BlueCFD":
         # Under blueCFD (mingw): c:\path -> /c/path
         if os.path.isabs(p):
             return "/" + (drive[:-1]).lower() + pp
@@ -446,31 +520,46 @@ def fromWindowsPath(p):
         return p
 
 
+# Absolute paths under WSL (/mnt/c/path) and mingw (/c/path), split into the drive and the rest of the path
+WSL_DRIVE_PATH = re.compile(r'/mnt/([^/]*)/?(.*)', re.DOTALL)
+MINGW_DRIVE_PATH = re.compile(r'/([^/]*)/?(.*)', re.DOTALL)
+
+
 def toWindowsPath(p):
-    pp = p.split('/')
-    if getFoamRuntime() == "BashWSL":
+    runtime = getFoamRuntime()
+    if runtime == "BashWSL":
         # bash on windows: /mnt/c/Path -> C:\Path
-        if p.startswith('/mnt/'):
-            return pp[2].toupper() + ':\\' + '\\'.join(pp[3:])
+        m = WSL_DRIVE_PATH.match(p)
+        if m:
+            return m.group(1).upper() + ':\\' + m.group(2).replace('/', '\\')
         else:
             return p.replace('/', '\\')
-    elif getFoamRuntime() == "BlueCFD":
+    elif runtime == "BlueCFD":
         # Under blueCFD (mingw): /c/path -> c:\path; /home/ofuser/blueCFD -> <blueCFDDir>
         if p.startswith('/home/ofuser/blueCFD'):
-            return getFoamDir() + '\\' + '..' + '\\' + '\\'.join(pp[4:])
-        elif p.startswith('/'):
-            return pp[1].upper() + ':\\' + '\\'.join(pp[2:])
+            return getFoamDir() + '\\' + '..' + '\\' + '\\'.join(p.split('/')[4:])
+        m = MINGW_DRIVE_PATH.match(p)
+        if m:
+            return m.group(1).upper() + ':\\' + m.group(2).replace('/', '\\')
         else:
             return p.replace('/', '\\')
     else:  # Nothing needed for posix
         return p
 
 
+# The platform does not change while running, so choose the path translations once rather than on every call
+if platform.system() == 'Windows':
+    translatePath = fromWindowsPath
+    reverseTranslatePath = toWindowsPath
+
+
 def getShortWindowsPath(long_name):
     """
     Gets the short path name of a given long path.
     http://stackoverflow.com/a/23598461/200291
     """
+    if long_name in SHORT_PATH_CACHE:
+        return SHORT_PATH_CACHE[long_name]
     import ctypes
     from ctypes import wintypes
     _GetShortPathNameW = ctypes.windll.kernel32.GetShortPathNameW
@@ -482,6 +571,9 @@ def getShortWindowsPath(long_name):
         output_buf = ctypes.create_unicode_buffer(output_buf_size)
         needed = _GetShortPathNameW(long_name, output_buf, output_buf_size)
         if output_buf_size >= needed:
+            if output_buf.value:
+                # Not cached on failure, as the path may not exist yet
+                SHORT_PATH_CACHE[long_name] = output_buf.value
             return output_buf.value
         else:
             output_buf_size = needed
@@ -520,11 +612,17 @@ def makeRunCommand(cmd, dir, source_env=True):
         cmdline = ['bash', '-c', source + cd + cmd]
         return cmdline
     elif getFoamRuntime() == "BlueCFD":
-        # Set-up necessary for running a command - only needs doing once, but to be safe...
+        # Set-up necessary for running a command - only needs doing once, so skip it if already up to date
         short_bluecfd_path = getShortWindowsPath('{}\\..'.format(installation_path))
-        with open('{}\\..\\msys64\\home\\ofuser\\.blueCFDOrigin'.format(installation_path), "w") as f:
-            f.write(short_bluecfd_path)
-            f.close()
+        origin_path = '{}\\..\\msys64\\home\\ofuser\\.blueCFDOrigin'.format(installation_path)
+        try:
+            with open(origin_path, "r") as f:
+                current_origin = f.read()
+        except IOError:
+            current_origin = None
+        if current_origin != short_bluecfd_path:
+            with open(origin_path, "w") as f:
+                f.write(short_bluecfd_path)
 
         # Note: Prefixing bash call with the *short* path can prevent errors due to spaces in paths
         # when running linux tools - specifically when building
@@ -553,19 +651,21 @@ def runFoamCommand(cmdline, case=None):
 
 class CfdSynchronousFoamProcess:
     def __init__(self):
-        self.process = CfdConsoleProcess.CfdConsoleProcess(stdoutHook=self.readOutput, stderrHook=self.readOutput)
+        # Output is collected in pieces and joined once finished, rather than re-copying the whole string each time
+        self.output_chunks = []
+        self.process = CfdConsoleProcess.CfdConsoleProcess(stdoutHook=self.output_chunks.append,
+                                                           stderrHook=self.output_chunks.append)
         self.output = ""
 
     def run(self, cmdline, case=None):
         print("Running ", cmdline)
         self.process.start(makeRunCommand(cmdline, case), env_vars=getRunEnvironment())
-        if not self.process.waitForFinished():
+        finished = self.process.waitForFinished()
+        self.output = ''.join(self.output_chunks)
+        if not finished:
             raise Exception("Unable to run command " + cmdline)
         return self.process.exitCode()
 
-    def readOutput(self, output):
-        self.output += output
-
 
 def startFoamApplication(cmd, case, log_name='', finishedHook=None, stdoutHook=None, stderrHook=None):
     """ Run command cmd in OpenFOAM environment, sending output to log file.
@@ -638,12 +738,17 @@ def convertMesh(case, mesh_file, scale):
 
 
 def readTemplate(fileName, replaceDict=None):
-    helperFile = open(fileName, 'r')
-    helperText = helperFile.read()
-    for key in replaceDict:
-        helperText = helperText.replace("#"+key+"#", "{}".format(replaceDict[key]))
-    helperFile.close()
-    return helperText
+    with open(fileName, 'r') as helperFile:
+        helperText = helperFile.read()
+    if not replaceDict:
+        return helperText
+    # Replace all the #key# placeholders in a single scan of the text
+    keys = tuple(sorted(replaceDict, key=len, reverse=True))
+    pattern = TEMPLATE_PATTERN_CACHE.get(keys)
+    if pattern is None:
+        pattern = re.compile('#(' + '|'.join(re.escape(k) for k in keys) + ')#')
+        TEMPLATE_PATTERN_CACHE[keys] = pattern
+    return pattern.sub(lambda m: "{}".format(replaceDict[m.group(1)]), helperText)
 
 
 def checkCfdDependencies(term_print=True):
@@ -680,13 +785,8 @@ def checkCfdDependencies(term_print=True):
             # If we don't have the git version, assume it's OK.
             gitver = FC_COMMIT_REQUIRED
 
-        if (major_ver < FC_MAJOR_VER_REQUIRED or
-            (major_ver == FC_MAJOR_VER_REQUIRED and
-             (minor_ver < FC_MINOR_VER_REQUIRED or
-              (minor_ver == FC_MINOR_VER_REQUIRED and patch_ver < FC_PATCH_VER_REQUIRED)
-             )
-            )
-           ) or gitver < FC_COMMIT_REQUIRED:
+        if ((major_ver, minor_ver, patch_ver) < (FC_MAJOR_VER_REQUIRED, FC_MINOR_VER_REQUIRED, FC_PATCH_VER_REQUIRED)
+                or gitver < FC_COMMIT_REQUIRED):
             fc_msg = "FreeCAD version ({}.{}.{}) ({}) must be at least {}.{}.{} ({})".format(
                 int(ver[0]), minor_ver, patch_ver, gitver,
                 FC_MAJOR_VER_REQUIRED, FC_MINOR_VER_REQUIRED, FC_PATCH_VER_REQUIRED, FC_COMMIT_REQUIRED)
@@ -697,6 +797,7 @@ def checkCfdDependencies(term_print=True):
         # check openfoam
         if term_print:
             print("Checking for OpenFOAM:")
+        foam_probe = {}
         try:
             foam_dir = getFoamDir()
         except IOError as e:
@@ -713,7 +814,14 @@ def checkCfdDependencies(term_print=True):
                 message += ofmsg + '\n'
             else:
                 try:
-                    foam_ver = runFoamCommand("echo $WM_PROJECT_VERSION")
+                    # Probe for everything in one shell, as sourcing the OpenFOAM environment is slow. Results are
+                    # output on lines tagged with ###<name>=; the line is absent if the tool was not found.
+                    probe_output = runFoamCommand('{ ' + '; '.join([
+                        'printf "###WM=%s\\n" "$WM_PROJECT_VERSION"',
+                        'if out=$(cartesianMesh -version 2>&1); then '
+                        'printf "###CFMESH=%s\\n" "$(printf "%s" "$out" | tr "\\n" " ")"; fi',
+                        'if hisa -help > /dev/null 2>&1; then echo "###HISA="; fi',
+                        'printf "###PV=%s\\n" "$(which paraview 2> /dev/null)"']) + '; }')
                 except Exception as e:
                     runmsg = "OpenFOAM installation found, but unable to run command: " + str(e)
                     message += runmsg + '\n'
@@ -721,7 +829,13 @@ def checkCfdDependencies(term_print=True):
                         print(runmsg)
                     raise
                 else:
-                    foam_ver = foam_ver.rstrip().split()[-1]
+                    for line in probe_output.splitlines():
+                        if line.startswith('###'):
+                            name, _, value = line[3:].partition('=')
+                            foam_probe[name] = value.strip()
+
+                    foam_ver = foam_probe.get('WM', '')
+                    foam_ver = foam_ver.split()[-1] if foam_ver else foam_ver
                     if foam_ver != 'dev' and foam_ver != 'plus':
                         try:
                             # Isolate major version number
@@ -748,10 +862,9 @@ def checkCfdDependencies(term_print=True):
                                 print(vermsg)
 
                     # Check for cfMesh
-                    try:
-                        cfmesh_ver = runFoamCommand("cartesianMesh -version")
-                        cfmesh_ver = cfmesh_ver.rstrip().split()[-1]
-                        cfmesh_ver = cfmesh_ver.split('.')
+                    if 'CFMESH' in foam_probe:
+                        cfmesh_ver = foam_probe['CFMESH'].split()
+                        cfmesh_ver = cfmesh_ver[-1].split('.') if cfmesh_ver else cfmesh_ver
                         if (not cfmesh_ver or len(cfmesh_ver) != 2 or
                             int(cfmesh_ver[0]) < CF_MAJOR_VER_REQUIRED or
                             (int(cfmesh_ver[0]) == CF_MAJOR_VER_REQUIRED and
@@ -761,16 +874,14 @@ def checkCfdDependencies(term_print=True):
                             message += vermsg + "\n"
                             if term_print:
                                 print(vermsg)
-                    except subprocess.CalledProcessError:
+                    else:
                         cfmesh_msg = "cfMesh (CfdOF version) not found"
                         message += cfmesh_msg + '\n'
                         if term_print:
                             print(cfmesh_msg)
 
                     # Check for HiSA
-                    try:
-                        runFoamCommand("hisa -help")
-                    except subprocess.CalledProcessError:
+                    if 'HISA' not in foam_probe:
                         hisa_msg = "HiSA not found"
                         message += hisa_msg + '\n'
                         if term_print:
@@ -780,11 +891,13 @@ def checkCfdDependencies(term_print=True):
             if term_print:
                 print("Checking for paraview:")
             paraview_cmd = "paraview"
-            import distutils.spawn
-            if distutils.spawn.find_executable(paraview_cmd) is None:
+            if findExecutable(paraview_cmd) is None:
                 # If not found, try to run from the OpenFOAM environment, in case a bundled version is
                 # available from there
-                pv_path = runFoamCommand("which paraview")
+                if 'PV' in foam_probe:
+                    pv_path = foam_probe['PV']
+                else:
+                    pv_path = runFoamCommand("which paraview")
                 if not pv_path.rstrip():
                     pv_msg = "Paraview executable " + paraview_cmd + " not found in system or OpenFOAM path."
                     message += pv_msg + '\n'
@@ -817,9 +930,8 @@ def checkCfdDependencies(term_print=True):
         # check that gmsh version 2.13 or greater is installed
         gmshversion = ""
         try:
-            gmshversion = subprocess.check_output(["gmsh", "-version"],
-                                                  stderr=subprocess.STDOUT, universal_newlines=True)
-        except OSError or subprocess.CalledProcessError:
+            gmshversion = getGmshVersion()
+        except (OSError, subprocess.CalledProcessError):
             gmsh_msg = "gmsh is not installed"
             message += gmsh_msg + '\n'
             if term_print:
@@ -840,6 +952,28 @@ def checkCfdDependencies(term_print=True):
         return message
 
 
+def findExecutable(cmd):
+    """ Return the path to the executable cmd, or None if not found. Found executables are cached for the current
+    PATH; misses are not, in case the program is installed later. """
+    key = (cmd, os.environ.get('PATH', ''))
+    exe = EXECUTABLE_CACHE.get(key)
+    if exe is None:
+        exe = which(cmd)
+        if exe:
+            EXECUTABLE_CACHE[key] = exe
+    return exe
+
+
+def getGmshVersion():
+    """ Return the output of 'gmsh -version'. Successful results are cached for the current PATH; failure to run
+    is not cached, in case gmsh is installed later. """
+    path = os.environ.get('PATH', '')
+    if path not in GMSH_VERSION_CACHE:
+        GMSH_VERSION_CACHE[path] = subprocess.check_output(["gmsh", "-version"],
+                                                           stderr=subprocess.STDOUT, universal_newlines=True)
+    return GMSH_VERSION_CACHE[path]
+
+
 def startParaview(case_path, script_name, consoleMessageFn):
     proc = QtCore.QProcess()
     # If using blueCFD, use paraview supplied
@@ -850,8 +984,7 @@ def startParaview(case_path, script_name, consoleMessageFn):
     arg = '--script={}'.format(script_name)
     # Otherwise, the command 'paraview' must be in the path. Possibly make path user-settable.
     # Test to see if it exists, as the exception thrown is cryptic on Windows if it doesn't
-    import distutils.spawn
-    if distutils.spawn.find_executable(paraview_cmd) is None:
+    if findExecutable(paraview_cmd) is None:
         # If not found, try to run from the OpenFOAM environment, in case a bundled version is available from there
         paraview_cmd = "$(which paraview)"  # 'which' required due to mingw weirdness(?) on Windows
         try:
@@ -874,80 +1007,163 @@ def startParaview(case_path, script_name, consoleMessageFn):
 
 def floatEqual(a, b):
     """ Test whether a and b are equal within an absolute and relative tolerance """
-    reltol = 10*sys.float_info.epsilon
-    abstol = 1e-12  # Seems to be necessary on file read/write
-    return abs(a-b) < abstol or abs(a - b) <= reltol*max(abs(a), abs(b))
+    diff = abs(a - b)
+    return diff < FLOAT_EQUAL_ABSTOL or diff <= FLOAT_EQUAL_RELTOL*max(abs(a), abs(b))
+
+
+def floatEqualArray(a, b):
+    """ Element-wise version of floatEqual for numpy arrays """
+    diff = numpy.abs(a - b)
+    return (diff < FLOAT_EQUAL_ABSTOL) | (diff <= FLOAT_EQUAL_RELTOL*numpy.maximum(numpy.abs(a), numpy.abs(b)))
+
+
+def boundBoxesOverlap(bb1, bb2):
+    """ Test whether two bounding boxes overlap, allowing for floatEqual tolerance at the edges """
+    for min1, max1, min2, max2 in ((bb1.XMin, bb1.XMax, bb2.XMin, bb2.XMax),
+                                   (bb1.YMin, bb1.YMax, bb2.YMin, bb2.YMax),
+                                   (bb1.ZMin, bb1.ZMax, bb2.ZMin, bb2.ZMax)):
+        if (max1 < min2 and not floatEqual(max1, min2)) or (max2 < min1 and not floatEqual(max2, min1)):
+            return False
+    return True
 
 
 def isSameGeometry(shape1, shape2):
     """ Copy of FemMeshTools.is_same_geometry, with fixes """
+    # Cheap rejection first. The boxes are not compared for equality because OCC may enlarge them
+    # (e.g. b-spline control hull or triangulation), but those of identical shapes always overlap.
+    if not boundBoxesOverlap(shape1.BoundBox, shape2.BoundBox):
+        return False
     # Check Area, CenterOfMass because non-planar shapes might not have more than one vertex defined
-    same_Vertexes = 0
+    vertexes1 = shape1.Vertexes
+    vertexes2 = shape2.Vertexes
     # Bugfix: below was 1 - did not work for non-planar shapes
-    if len(shape1.Vertexes) == len(shape2.Vertexes) and len(shape1.Vertexes) > 0:
-        # compare CenterOfMass
-        # Bugfix: Precision seems to be lost on load/save
-        if not floatEqual(shape1.CenterOfMass[0], shape2.CenterOfMass[0]) or \
-                not floatEqual(shape1.CenterOfMass[1], shape2.CenterOfMass[1]) or \
-                not floatEqual(shape1.CenterOfMass[2], shape2.CenterOfMass[2]):
-            return False
-        elif not floatEqual(shape1.Area, shape2.Area):
+    if len(vertexes1) != len(vertexes2) or not vertexes1:
+        return False
+    # compare CenterOfMass
+    # Bugfix: Precision seems to be lost on load/save
+    com1 = shape1.CenterOfMass
+    com2 = shape2.CenterOfMass
+    if not floatEqual(com1[0], com2[0]) or not floatEqual(com1[1], com2[1]) or not floatEqual(com1[2], com2[2]):
+        return False
+    elif not floatEqual(shape1.Area, shape2.Area):
+        return False
+    else:
+        return verticesCoincide(vertexPoints(shape1), vertexPoints(shape2))
+
+
+def vertexPoints(shape):
+    """ Return the coordinates of the shape's vertexes as an (n, 3) array """
+    return numpy.array([(v.X, v.Y, v.Z) for v in shape.Vertexes]).reshape(-1, 3)
+
+
+def verticesCoincide(points1, points2):
+    """ Whether each point in points1 coincides with one in points2. Small sets are compared all pairs at once;
+    otherwise each point is only compared with those of points2 in a band of x around it, so that memory stays
+    bounded. """
+    # Bugfix: a vertex is not consumed by its match - avoids false-negative with repeated vertices
+    if len(points1)*len(points2) <= VERTEX_BROADCAST_LIMIT:
+        coincident = floatEqualArray(points1[:, numpy.newaxis, :], points2[numpy.newaxis, :, :]).all(axis=2)
+        return bool(coincident.any(axis=1).all())
+    points2 = points2[numpy.argsort(points2[:, 0], kind='mergesort')]
+    x1 = points1[:, 0]
+    # Includes everything floatEqual in x
+    band = FLOAT_EQUAL_ABSTOL + 2*FLOAT_EQUAL_RELTOL*numpy.abs(x1)
+    lo = numpy.searchsorted(points2[:, 0], x1 - band, side='left')
+    hi = numpy.searchsorted(points2[:, 0], x1 + band, side='right')
+    for p, l, h in zip(points1, lo, hi):
+        if not floatEqualArray(points2[l:h], p).all(axis=1).any():
             return False
-        else:
-            # compare the Vertices
-            for vs1 in shape1.Vertexes:
-                for vs2 in shape2.Vertexes:
-                    if floatEqual(vs1.X, vs2.X) and floatEqual(vs1.Y, vs2.Y) and floatEqual(vs1.Z, vs2.Z):
-                        same_Vertexes += 1
-                        # Bugfix: was 'continue' - caused false-negative with repeated vertices
-                        break
-            if same_Vertexes == len(shape1.Vertexes):
-                return True
-            else:
-                return False
+    return True
+
 
+def geometryData(shape, com=None):
+    """ Extract the properties compared by isSameGeometry, to compare a shape several times with
+    isSameGeometryData. The centre of mass can be supplied if already known. """
+    if com is None:
+        com = numpy.array(tuple(shape.CenterOfMass))
+    return com, shape.Area, vertexPoints(shape)
 
-def findElementInShape(aShape, anElement):
-    """ Copy of FemMeshTools.find_element_in_shape, but calling isSameGeometry"""
+
+def isSameGeometryData(data1, data2):
+    """ isSameGeometry, using properties previously extracted with geometryData """
+    com1, area1, points1 = data1
+    com2, area2, points2 = data2
+    if len(points1) != len(points2) or not len(points1):
+        return False
+    return bool(floatEqualArray(com1, com2).all() and floatEqual(area1, area2) and verticesCoincide(points1, points2))
+
+
+def shapeCentre(shape):
+    """ Centre of mass of the shape, or the point of a vertex """
+    if shape.ShapeType == 'Vertex':
+        return numpy.array(tuple(shape.Point))
+    return numpy.array(tuple(shape.CenterOfMass))
+
+
+def centresOfMass(shapes):
+    """ Centres of mass of a list of shapes as an (n, 3) array """
+    coms = numpy.empty((len(shapes), 3))
+    for i, s in enumerate(shapes):
+        c = s.CenterOfMass
+        coms[i, 0] = c.x
+        coms[i, 1] = c.y
+        coms[i, 2] = c.z
+    return coms
+
+
+def findSameGeometry(aShape, elements_name, anElement, centres):
+    """ Return the index of the first sub-element of aShape that is the same geometry as anElement, or None. Only
+    elements with the same centre need the full comparison. The centres of the sub-elements are computed as far as
+    the search gets, and kept in the list centres[elements_name] for later searches of the same shape. """
+    elements = getattr(aShape, elements_name)
+    element_centres = centres.setdefault(elements_name, [])
+    centre = shapeCentre(anElement)
+    for index, element in enumerate(elements):
+        if index == len(element_centres):
+            element_centres.append(shapeCentre(element))
+        if floatEqualArray(element_centres[index], centre).all() and isSameGeometry(element, anElement):
+            return index
+    return None
+
+
+def findElementInShape(aShape, anElement, centres=None):
+    """ Copy of FemMeshTools.find_element_in_shape, but calling isSameGeometry
+    :param centres: Optional dict in which to keep the sub-element centres of aShape between calls searching the
+    same shape; it should not outlive the search
+    """
+    if centres is None:
+        centres = {}
     # import Part
     ele_st = anElement.ShapeType
     if ele_st == 'Solid' or ele_st == 'CompSolid':
-        for index, solid in enumerate(aShape.Solids):
-            # print(is_same_geometry(solid, anElement))
-            if isSameGeometry(solid, anElement):
-                # print(index)
-                # Part.show(aShape.Solids[index])
-                ele = ele_st + str(index + 1)
-                return ele
+        index = findSameGeometry(aShape, 'Solids', anElement, centres)
+        if index is not None:
+            # Part.show(aShape.Solids[index])
+            ele = ele_st + str(index + 1)
+            return ele
         FreeCAD.Console.PrintError('Solid ' + str(anElement) + ' not found in: ' + str(aShape) + '\n')
         if ele_st == 'Solid' and aShape.ShapeType == 'Solid':
             print('We have been searching for a Solid in a Solid and we have not found it. In most cases this should be searching for a Solid inside a CompSolid. Check the ShapeType of your Part to mesh.')
         # Part.show(anElement)
         # Part.show(aShape)
     elif ele_st == 'Face' or ele_st == 'Shell':
-        for index, face in enumerate(aShape.Faces):
-            # print(is_same_geometry(face, anElement))
-            if isSameGeometry(face, anElement):
-                # print(index)
-                # Part.show(aShape.Faces[index])
-                ele = ele_st + str(index + 1)
-                return ele
+        index = findSameGeometry(aShape, 'Faces', anElement, centres)
+        if index is not None:
+            # Part.show(aShape.Faces[index])
+            ele = ele_st + str(index + 1)
+            return ele
     elif ele_st == 'Edge' or ele_st == 'Wire':
-        for index, edge in enumerate(aShape.Edges):
-            # print(is_same_geometry(edge, anElement))
-            if isSameGeometry(edge, anElement):
-                # print(index)
-                # Part.show(aShape.Edges[index])
-                ele = ele_st + str(index + 1)
-                return ele
+        index = findSameGeometry(aShape, 'Edges', anElement, centres)
+        if index is not None:
+            # Part.show(aShape.Edges[index])
+            ele = ele_st + str(index + 1)
+            return ele
     elif ele_st == 'Vertex':
-        for index, vertex in enumerate(aShape.Vertexes):
-            # print(is_same_geometry(vertex, anElement))
-            if isSameGeometry(vertex, anElement):
-                # print(index)
-                # Part.show(aShape.Vertexes[index])
-                ele = ele_st + str(index + 1)
-                return ele
+        index = findSameGeometry(aShape, 'Vertexes', anElement, centres)
+        if index is not None:
+            # Part.show(aShape.Vertexes[index])
+            ele = ele_st + str(index + 1)
+            return ele
     elif ele_st == 'Compound':
         FreeCAD.Console.PrintError('Compound is not supported.\n')
 
@@ -958,9 +1174,10 @@ def matchFacesToTargetShape(ref_lists, shape):
     :param shape: The shape to map to
     :return:  A list of tuples: (group index, reference) of matching refs for each face in shape
     """
-    # Preserve original indices
-    mesh_face_list = list(zip(shape.Faces, range(len(shape.Faces))))
-    src_face_list = []
+    mesh_faces = shape.Faces
+    src_faces = []
+    src_groups = []
+    src_refs = []
     for i, rl in enumerate(ref_lists):
         for br in rl:
             obj = FreeCAD.ActiveDocument.getObject(br[0])
@@ -972,111 +1189,51 @@ def matchFacesToTargetShape(ref_lists, shape):
             except Part.OCCError:
                 raise RuntimeError("Referenced face '{}:{}' not found - face may "
                                    "have been deleted".format(br[0], br[1]))
-            src_face_list.append((bf, i, br))
-
-    if sys.version_info >= (3,):  # Python 3
-
-        def compKeyFn(key):
-            class K(object):
-                def __init__(self, val, *args):
-                    self.val = key(val)
-
-                def __eq__(self, other):
-                    return floatEqual(self.val, other.val)
-
-                def __ne__(self, other):
-                    return not floatEqual(self.val, other.val)
-
-                def __lt__(self, other):
-                    return self.val < other.val and not floatEqual(self.val, other.val)
-
-                def __gt__(self, other):
-                    return self.val > other.val and not floatEqual(self.val, other.val)
-
-                def __le__(self, other):
-                    return self.val < other.val or floatEqual(self.val, other.val)
-
-                def __ge__(self, other):
-                    return self.val > other.val or floatEqual(self.val, other.val)
-
-            return K
-
-        # Sort boundary face list by centre of mass, x then y then z in case all in plane
-        src_face_list.sort(key=compKeyFn(lambda bf: bf[0].CenterOfMass.z))
-        src_face_list.sort(key=compKeyFn(lambda bf: bf[0].CenterOfMass.y))
-        src_face_list.sort(key=compKeyFn(lambda bf: bf[0].CenterOfMass.x))
-
-        # Same sorting on mesh face list
-        mesh_face_list.sort(key=compKeyFn(lambda mf: mf[0].CenterOfMass.z))
-        mesh_face_list.sort(key=compKeyFn(lambda mf: mf[0].CenterOfMass.y))
-        mesh_face_list.sort(key=compKeyFn(lambda mf: mf[0].CenterOfMass.x))
-
-    else:  # Python 2
+            src_faces.append(bf)
+            src_groups.append(i)
+            src_refs.append(br)
+
+    # Centres of mass of the boundary faces, ordered by x, y, z so that the candidates for each mesh face can be found
+    # by bisection on x. src_order maps back to the index of the face in src_faces.
+    src_com = centresOfMass(src_faces)
+    src_order = numpy.lexsort((src_com[:, 2], src_com[:, 1], src_com[:, 0]))
+    src_com = src_com[src_order]
+    src_com_x = src_com[:, 0]
+    # A tree also narrows down the other coordinates, e.g. when many faces lie in the same plane of constant x.
+    # scipy is optional, and only imported here so that loading the workbench does not wait for it.
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        cKDTree = None
+    src_tree = cKDTree(src_com) if cKDTree is not None and len(src_com) else None
 
-        def compFn(x, y):
-            if floatEqual(x, y):
-                return 0
-            elif x < y:
-                return -1
-            else:
-                return 1
-
-        # Sort boundary face list by centre of mass, x then y then z in case all in plane
-        src_face_list.sort(cmp=compFn, key=lambda bf: bf[0].CenterOfMass.z)
-        src_face_list.sort(cmp=compFn, key=lambda bf: bf[0].CenterOfMass.y)
-        src_face_list.sort(cmp=compFn, key=lambda bf: bf[0].CenterOfMass.x)
-
-        # Same sorting on mesh face list
-        mesh_face_list.sort(cmp=compFn, key=lambda mf: mf[0].CenterOfMass.z)
-        mesh_face_list.sort(cmp=compFn, key=lambda mf: mf[0].CenterOfMass.y)
-        mesh_face_list.sort(cmp=compFn, key=lambda mf: mf[0].CenterOfMass.x)
-
-    # Find faces with matching CofM
-    i = 0
-    j = 0
-    j_match_start = 0
-    matching = False
-    candidate_mesh_faces = []
-    for mf in mesh_face_list:
-        candidate_mesh_faces.append([])
-    while i < len(src_face_list) and j < len(mesh_face_list):
-        bf = src_face_list[i][0]
-        mf = mesh_face_list[j][0]
-        if floatEqual(bf.CenterOfMass.x, mf.CenterOfMass.x):
-            if floatEqual(bf.CenterOfMass.y, mf.CenterOfMass.y):
-                if floatEqual(bf.CenterOfMass.z, mf.CenterOfMass.z):
-                    candidate_mesh_faces[j].append((i, src_face_list[i][1], src_face_list[i][2]))
-                    cmp = 0
-                else:
-                    cmp = (-1 if bf.CenterOfMass.z < mf.CenterOfMass.z else 1)
-            else:
-                cmp = (-1 if bf.CenterOfMass.y < mf.CenterOfMass.y else 1)
-        else:
-            cmp = (-1 if bf.CenterOfMass.x < mf.CenterOfMass.x else 1)
-        if cmp == 0:
-            if not matching:
-                j_match_start = j
-            j += 1
-            matching = True
-        elif cmp < 0:
-            i += 1
-            if matching:
-                j = j_match_start
-            matching = False
-        elif cmp > 0:
-            j += 1
-            matching = False
-
-    # Do comprehensive matching, and reallocate to original index
+    # Find faces with matching CofM, then do comprehensive matching on those. The properties of each face are only
+    # extracted once even if it is compared repeatedly.
     successful_candidates = []
-    for mf in mesh_face_list:
-        successful_candidates.append([])
-    for j in range(len(candidate_mesh_faces)):
-        for k in range(len(candidate_mesh_faces[j])):
-            i, nb, bref = candidate_mesh_faces[j][k]
-            if isSameGeometry(src_face_list[i][0], mesh_face_list[j][0]):
-                orig_idx = mesh_face_list[j][1]
-                successful_candidates[orig_idx].append((nb, bref))
+    src_data = {}
+    mesh_com = centresOfMass(mesh_faces)
+    for mf, com in zip(mesh_faces, mesh_com):
+        # Search a neighbourhood that includes everything floatEqual to the mesh face's CofM; then filter exactly
+        if src_tree is not None:
+            band = FLOAT_EQUAL_ABSTOL + 2*FLOAT_EQUAL_RELTOL*numpy.abs(com).max()
+            near = numpy.array(sorted(src_tree.query_ball_point(com, band, p=numpy.inf)), dtype=int)
+        else:
+            band = FLOAT_EQUAL_ABSTOL + 2*FLOAT_EQUAL_RELTOL*abs(com[0])
+            lo = numpy.searchsorted(src_com_x, com[0] - band, side='left')
+            hi = numpy.searchsorted(src_com_x, com[0] + band, side='right')
+            near = numpy.arange(lo, hi)
+        matches = near[floatEqualArray(src_com[near], com).all(axis=1)]
+
+        successful = []
+        if len(matches):
+            mesh_data = geometryData(mf, com)
+            for i in matches:
+                j = src_order[i]
+                if j not in src_data:
+                    src_data[j] = geometryData(src_faces[j], src_com[i])
+                if isSameGeometryData(src_data[j], mesh_data):
+                    successful.append((src_groups[j], src_refs[j]))
+        successful_candidates.append(successful)
 
     return successful_candidates
 
@@ -1088,13 +1245,22 @@ def setActiveAnalysis(analysis):
             obj.IsActiveAnalysis = False
 
     analysis.IsActiveAnalysis = True
+    ACTIVE_ANALYSIS_CACHE[analysis.Document.Name] = analysis.Name
 
 
 def getActiveAnalysis():
+    # Objects are looked up by name rather than held on to, so that a deleted analysis is not returned
+    doc = FreeCAD.ActiveDocument
+    name = ACTIVE_ANALYSIS_CACHE.get(doc.Name)
+    if name is not None:
+        obj = doc.getObject(name)
+        if obj is not None and getattr(obj, 'IsActiveAnalysis', False):
+            return obj
     from CfdAnalysis import _CfdAnalysis
-    for obj in FreeCAD.ActiveDocument.Objects:
+    for obj in doc.Objects:
         if hasattr(obj, 'Proxy') and isinstance(obj.Proxy, _CfdAnalysis):
             if obj.IsActiveAnalysis:
+                ACTIVE_ANALYSIS_CACHE[doc.Name] = obj.Name
                 return obj
     return None
 
@@ -1116,7 +1282,9 @@ def addObjectProperty(obj, prop, init_val, type, *args):
 
 
 def relLenToRefinementLevel(rel_len):
-    return math.ceil(math.log(1.0/rel_len)/math.log(2))
+    """ Number of halvings needed to reduce the length to at most rel_len, i.e. ceil(log2(1/rel_len)). With
+    rel_len = m*2**e (0.5 <= m < 1) this is exactly 1-e, so take it from the float's exponent rather than logs. """
+    return 1 - math.frexp(rel_len)[1]
 
 
 def importMaterials():
@@ -1131,51 +1299,56 @@ def importMaterials():
 
 
 def addMatDir(mat_dir, materials):
-    import glob
-    import os
     import Material
-    mat_file_extension = ".FCMat"
+    # normcase folds case only where the filesystem is case-insensitive, as glob does
+    mat_file_extension = os.path.normcase(".FCMat")
     ext_len = len(mat_file_extension)
-    dir_path_list = glob.glob(mat_dir + '/*' + mat_file_extension)
+    # Filter a single directory listing rather than globbing (which, like it, skips hidden files)
+    file_names = os.listdir(mat_dir) if os.path.isdir(mat_dir) else []
     material_name_path_list = []
-    for a_path in dir_path_list:
-        material_name = os.path.basename(a_path[:-ext_len])
-        materials[a_path] = Material.importFCMat(a_path)
-        material_name_path_list.append([material_name, a_path])
+    for file_name in file_names:
+        if os.path.normcase(file_name).endswith(mat_file_extension) and not file_name.startswith('.'):
+            a_path = os.path.join(mat_dir, file_name)
+            material_name = file_name[:-ext_len]
+            materials[a_path] = Material.importFCMat(a_path)
+            material_name_path_list.append([material_name, a_path])
     material_name_path_list.sort()
 
     return material_name_path_list
 
 
-QUANTITY_PROPERTIES = ['App::PropertyQuantity',
-                       'App::PropertyLength',
-                       'App::PropertyDistance',
-                       'App::PropertyAngle',
-                       'App::PropertyArea',
-                       'App::PropertyVolume',
-                       'App::PropertySpeed',
-                       'App::PropertyAcceleration',
-                       'App::PropertyForce',
-                       'App::PropertyPressure']
+QUANTITY_PROPERTIES = frozenset(['App::PropertyQuantity',
+                                 'App::PropertyLength',
+                                 'App::PropertyDistance',
+                                 'App::PropertyAngle',
+                                 'App::PropertyArea',
+                                 'App::PropertyVolume',
+                                 'App::PropertySpeed',
+                                 'App::PropertyAcceleration',
+                                 'App::PropertyForce',
+                                 'App::PropertyPressure'])
 
 
 def propsToDict(obj):
     """ Convert an object's properties to dictionary entries, converting any PropertyQuantity to float in SI units """
     d = {}
+    getTypeIdOfProperty = obj.getTypeIdOfProperty
     for k in obj.PropertiesList:
-        if obj.getTypeIdOfProperty(k) in QUANTITY_PROPERTIES:
-            q = Units.Quantity(getattr(obj, k))
+        v = getattr(obj, k)
+        if getTypeIdOfProperty(k) in QUANTITY_PROPERTIES:
+            q = Units.Quantity(v)
             # q.Value is in FreeCAD internal units, which is same as SI except for mm instead of m
-            d[k] = q.Value/1000**q.Unit.Signature[0]
-        else:
-            d[k] = getattr(obj, k)
+            v = q.Value/1000**q.Unit.Signature[0]
+        d[k] = v
     return d
 
 
+# Command to open a directory in the file manager of this platform
+FILE_MANAGER_COMMAND = {'Darwin': ['open', '--'],
+                        'Linux': ['xdg-open'],
+                        'Windows': ['explorer']}.get(platform.system())
+
+
 def openFileManager(case_path):
-    if platform.system() == 'MacOS':
-        subprocess.Popen(['open', '--', case_path])
-    elif platform.system() == 'Linux':
-        subprocess.Popen(['xdg-open', case_path])
-    elif platform.system() == 'Windows':
-        subprocess.Popen(['explorer', case_path])
+    if FILE_MANAGER_COMMAND:
+        subprocess.Popen(FILE_MANAGER_COMMAND + [case_path])
@@ -25,26 +25,68 @@
 from __future__ import print_function
 import re
 import os
+import errno
+from multiprocessing.pool import ThreadPool
+
+# Opening and corresponding closing brackets of the template syntax
+BRACKETS = {'%(': '%)', '%[': '%]', '%{': '%}'}
+
+# Matches keys that consist only of digits, used as stack or list indices
+INDEX_KEY = re.compile(r"[0-9]+\Z")
 
 
 class BracketError(ValueError):
     pass
 
 
+# Contents of template files already read, keyed by path, along with their modification time when read
+TEMPLATE_FILE_CACHE = {}
+
+
+def readTemplateFile(path):
+    """ Return the contents of a template file, re-reading it only if it has changed since last read.
+    Raises IOError if the file cannot be read. """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError as err:
+        raise IOError(str(err))
+    cached = TEMPLATE_FILE_CACHE.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path) as fid:
+        contents = fid.read()
+    TEMPLATE_FILE_CACHE[path] = (mtime, contents)
+    return contents
+
+
 class TemplateBuilder(object):
     """ Build a case directory from a template directory by substituting
      values in a python settings dictionary """
     def __init__(self,
                  case_path,
                  template_path,
-                 settings):
+                 settings,
+                 executable_files=()):
         if case_path[0] == "~":
             case_path = os.path.expanduser(case_path)
         self.case_path = os.path.abspath(case_path)
         self.settings = settings
         self.template_path = template_path
+        # Output files (relative to the case base) to be created with the execute permission set
+        self.executable_files = set(os.path.normpath(f) for f in executable_files)
 
-        self.buildDir('.')
+        # Output files are written on a worker thread, so that disk I/O overlaps with processing of the remaining
+        # templates. A single worker keeps the writes in order.
+        writer = ThreadPool(1)
+        self.pending_writes = []
+        self.writer = writer
+        try:
+            self.buildDir('.')
+        finally:
+            writer.close()
+            writer.join()
+        for w in self.pending_writes:
+            w.get()  # Re-raise any error from writing
 
     def buildDir(self, rel_dir):
         """ Recursively build files in dir (relative to case base) """
@@ -62,24 +104,30 @@ class TemplateBuilder(object):
                         self.writeToFile(rel_file, contents)
 
     def writeToFile(self, rel_file, contents):
+        self.pending_writes.append(self.writer.apply_async(self.writeFile, (rel_file, contents)))
+
+    def writeFile(self, rel_file, contents):
         # Make sure directory tree exists
         path = os.path.join(self.case_path, os.path.dirname(rel_file))
         try:
             os.makedirs(path)
         except OSError as exc:
-            import errno
             if exc.errno == errno.EEXIST and os.path.isdir(path):
                 pass
             else:
                 raise
-        # Write file
-        with open(os.path.join(self.case_path, rel_file), 'w') as ofid:
+        # Write file, setting the permissions at creation (the umask still applies). O_BINARY stops the Windows
+        # runtime translating newlines a second time, on top of the text-mode file object.
+        mode = 0o755 if os.path.normpath(rel_file) in self.executable_files else 0o666
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+        fd = os.open(os.path.join(self.case_path, rel_file), flags, mode)
+        with os.fdopen(fd, 'w') as ofid:
             ofid.write(contents)
 
     def buildFile(self, rel_file, params):
         """ Open the specified template file, make replacements, and return as a string """
         try:
-            fid = open(os.path.join(self.template_path, rel_file))
+            contents = readTemplateFile(os.path.join(self.template_path, rel_file))
         except IOError:
             # Special cases:
             # 1. Don't worry if files that end with "None" do not exist
@@ -88,13 +136,11 @@ class TemplateBuilder(object):
             # 2. If a file is not found, try the same file with 'default' after the last underscore
             rel_file_default = rel_file.rsplit("_", 1)[0] + "_default"
             try:
-                fid = open(os.path.join(self.template_path, rel_file_default))
+                contents = readTemplateFile(os.path.join(self.template_path, rel_file_default))
             except IOError:
                 raise IOError("Error reading file {} in template path {}".format(rel_file, self.template_path))
             finally:
                 rel_file = rel_file_default
-        contents = fid.read()
-        fid.close()
         try:
             contents = self.process(contents, rel_file, params)
         except BracketError as err:
@@ -108,36 +154,35 @@ class TemplateBuilder(object):
 
     def findAtCurrentLevel(self, string, find_string, start):
         """ Find the specified string, ignoring anything inside brackets """
-        brackets = {'%(': '%)', '%[': '%]', '%{': '%}'}
         while True:
             n = string.find(find_string, start)
             if n < 0:
                 return None
-            next_bra = [string.find(b, start) for b in brackets.keys()]
-            next_ket = [string.find(b, start) for b in brackets.values()]
-            for i in range(len(next_bra)):
-                if next_bra[i] < 0:
-                    next_bra[i] = len(string)
-            for i in range(len(next_ket)):
-                if next_ket[i] < 0:
-                    next_ket[i] = len(string)
-            if min(next_ket) < min(next_bra):
-                if n <= min(next_ket):
+            # Position of the nearest opening and closing brackets, or the end of the string if there are none
+            next_bra = next_ket = len(string)
+            for bra, ket in BRACKETS.items():
+                i = string.find(bra, start)
+                if 0 <= i < next_bra:
+                    next_bra = i
+                i = string.find(ket, start)
+                if 0 <= i < next_ket:
+                    next_ket = i
+            if next_ket < next_bra:
+                if n <= next_ket:
                     return n
                 else:
                     return None
             else:
-                if n <= min(next_bra):
+                if n <= next_bra:
                     return n
                 else:
-                    end = self.findClosingBracket(string, min(next_bra))
+                    end = self.findClosingBracket(string, next_bra)
                     start = end+2
 
     def findClosingBracket(self, string, start):
         """ Find the closing bracket corresponding to the one at the start """
-        brackets = {'%(': '%)', '%[': '%]', '%{': '%}'}
         bra = string[start:start+2]
-        ket = brackets[bra]
+        ket = BRACKETS[bra]
         found = self.findAtCurrentLevel(string, ket, start+2)
         if found is None:
             raise BracketError("Error matching {} ...".format(string[start:start+40]))
@@ -245,8 +290,7 @@ class TemplateBuilder(object):
             # Make any replacements
             key = self.process(key, curr_file, params)
             # Special case - if key is a number, treat as positional parameter
-            match = re.match("[0-9]+", key)
-            if match and match.span() == (0, len(key)):
+            if INDEX_KEY.match(key):
                 try:
                     replace = str(params[int(key)])
                 except IndexError:
@@ -264,8 +308,7 @@ class TemplateBuilder(object):
                         dic = dic[k]
                     elif isinstance(dic, list):
                         # Lists must be indexed with an integer
-                        match = re.match("[0-9]+", k)
-                        if match and match.span() == (0, len(k)):
+                        if INDEX_KEY.match(k):
                             dic = dic[int(k)]
                         else:
                             dic = "None"